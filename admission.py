@@ -0,0 +1,250 @@
+import os
+import time
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from flask import request, jsonify, g
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from pymongo import monitoring
+
+# Configuratie
+# G2_ADMISSION_ENABLED: 0 zet rate limits, concurrency caps en load shedding volledig uit
+# Rate limits gebruiken de notatie van Flask-Limiter ("10/second;300/minute").
+# G2_RATE_STORAGE_URI: memory:// (per proces) of een gedeelde backend zoals redis://host:6379
+#                      of mongodb://mongo:27017, zodat meerdere gateway processen één budget delen.
+ADMISSION_ENABLED = os.environ.get('G2_ADMISSION_ENABLED', '1') != '0'
+RATE_STORAGE_URI = os.environ.get('G2_RATE_STORAGE_URI', 'memory://')
+RATE_LIMIT = os.environ.get('G2_RATE_LIMIT', '20/second;600/minute')
+FULL_READ_LIMIT = os.environ.get('G2_RATE_LIMIT_FULL_READ', '2/second;60/minute')
+UPLOAD_LIMIT = os.environ.get('G2_RATE_LIMIT_UPLOAD', '5/second;100/minute')
+EXPORT_LIMIT = os.environ.get('G2_RATE_LIMIT_EXPORT', '5/minute')
+
+# Gelijktijdige requests per client (0 = geen limiet); dure operaties hebben een eigen, lager plafond
+MAX_CONCURRENT = int(os.environ.get('G2_MAX_CONCURRENT_PER_CLIENT', '8'))
+MAX_CONCURRENT_EXPENSIVE = int(os.environ.get('G2_MAX_CONCURRENT_EXPENSIVE_PER_CLIENT', '2'))
+
+# Load shedding: boven deze gemiddelde Mongo latency / pool wachttijd van client requests (over SHED_WINDOW_S)
+# worden dure operaties geweigerd, boven het dubbele alle client requests (0 = uit)
+SHED_LATENCY_MS = float(os.environ.get('G2_SHED_LATENCY_MS', '250'))
+SHED_POOL_WAIT_MS = float(os.environ.get('G2_SHED_POOL_WAIT_MS', '100'))
+SHED_WINDOW_S = float(os.environ.get('G2_SHED_WINDOW_S', '10'))
+SHED_RETRY_AFTER = '2'
+
+# Throttle tellers worden per client bijgehouden; de minst recent geweigerde clients vallen eruit
+MAX_TRACKED_CLIENTS = int(os.environ.get('G2_MAX_TRACKED_CLIENTS', '10000'))
+
+# (view, method) combinaties die een apart, krapper budget krijgen
+EXPENSIVE = {
+    ('api_collection', 'GET'),
+    ('admin_exp', 'GET'),
+    ('file_handler.upload_file', 'POST'),
+}
+
+def client_key():
+    return request.headers.get('x-client-id') or request.args.get('client_id') or get_remote_address()
+
+def client_endpoint_key():
+    view_args = request.view_args or {}
+    endpoint = view_args.get('collection_name') or view_args.get('ep_name') or request.endpoint
+    return f"{client_key()}:{endpoint}"
+
+# --- TELLERS ---
+
+_lock = threading.Lock()
+_in_flight = {}
+_throttled = OrderedDict()
+
+def _count(client_id, reason):
+    with _lock:
+        counters = _throttled.setdefault(client_id, {'rate': 0, 'concurrency': 0, 'shed': 0})
+        counters[reason] += 1
+        _throttled.move_to_end(client_id)
+        while len(_throttled) > MAX_TRACKED_CLIENTS:
+            _throttled.popitem(last=False)
+
+def throttle_counts(client_id):
+    with _lock:
+        return dict(_throttled.get(client_id, {'rate': 0, 'concurrency': 0, 'shed': 0}))
+
+def _on_breach(request_limit):
+    _count(client_key(), 'rate')
+
+limiter = Limiter(
+    key_func=client_key,
+    storage_uri=RATE_STORAGE_URI,
+    strategy='moving-window',
+    headers_enabled=True,
+    on_breach=_on_breach,
+    enabled=ADMISSION_ENABLED
+)
+
+# --- MONGO LOAD ---
+
+class _Window:
+    """Gemiddelde van de metingen in de laatste SHED_WINDOW_S seconden."""
+
+    def __init__(self):
+        self._samples = deque(maxlen=2000)
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self._samples.append((time.monotonic(), value))
+
+    def avg(self):
+        cutoff = time.monotonic() - SHED_WINDOW_S
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            if not self._samples:
+                return 0.0
+            return sum(v for _, v in self._samples) / len(self._samples)
+
+mongo_latency = _Window()
+pool_wait = _Window()
+
+# Alleen Mongo commando's die een client request afhandelen tellen mee. Ingest flushes, jobs,
+# snapshots en de slowlog draaien op dezelfde clients maar zeggen niets over wat clients merken.
+# pymongo roept de listeners aan op de thread die het commando uitvoert.
+_sampling = threading.local()
+
+def _sampled():
+    return getattr(_sampling, 'active', False)
+
+@contextmanager
+def unsampled():
+    """Mongo werk binnen een request dat niet mee mag tellen voor load shedding."""
+    previous = _sampled()
+    _sampling.active = False
+    try:
+        yield
+    finally:
+        _sampling.active = previous
+
+class _CommandLatencyListener(monitoring.CommandListener):
+    def started(self, event): pass
+
+    def succeeded(self, event):
+        if _sampled(): mongo_latency.add(event.duration_micros / 1000)
+
+    def failed(self, event):
+        if _sampled(): mongo_latency.add(event.duration_micros / 1000)
+
+class _PoolWaitListener(monitoring.ConnectionPoolListener):
+    _local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.perf_counter() if _sampled() else None
+
+    def _done(self):
+        start = getattr(self._local, 'start', None)
+        if start is not None:
+            pool_wait.add((time.perf_counter() - start) * 1000)
+            self._local.start = None
+
+    def connection_checked_out(self, event): self._done()
+    def connection_check_out_failed(self, event): self._done()
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_checked_in(self, event): pass
+
+# Globaal registreren: geldt voor elke MongoClient die hierna wordt aangemaakt
+monitoring.register(_CommandLatencyListener())
+monitoring.register(_PoolWaitListener())
+
+def load_level():
+    """0 = normaal, 1 = dure operaties weigeren, 2 = alle client requests weigeren."""
+    level = 0
+    for window, threshold in ((mongo_latency, SHED_LATENCY_MS), (pool_wait, SHED_POOL_WAIT_MS)):
+        if threshold <= 0: continue
+        avg = window.avg()
+        if avg > threshold * 2: level = max(level, 2)
+        elif avg > threshold: level = max(level, 1)
+    return level
+
+# --- REQUEST HOOKS ---
+
+def _is_expensive():
+    if (request.endpoint, request.method) in EXPENSIVE:
+        return True
+    # Export jobs via de job queue tellen ook als dure operatie
+    return request.endpoint == 'jobs.admin_submit_job' and _job_type() == 'export'
+
+def _job_type():
+    return (request.get_json(silent=True) or {}).get('type')
+
+def _too_many(reason, retry_after):
+    return jsonify({"error": "Too Many Requests", "reason": reason}), 429, {'Retry-After': retry_after}
+
+def _admit():
+    # Statische bestanden en het dashboard vallen buiten admission control
+    if not ADMISSION_ENABLED or not request.path.startswith('/api/'):
+        return None
+    client_id = client_key()
+    expensive = _is_expensive()
+    is_admin = request.path.startswith('/api/admin/')
+
+    level = load_level()
+    if (level >= 2 and not is_admin) or (level >= 1 and expensive):
+        _count(client_id, 'shed')
+        return _too_many('overloaded', SHED_RETRY_AFTER)
+
+    with _lock:
+        flight = _in_flight.setdefault(client_id, {'all': 0, 'expensive': 0})
+        if (MAX_CONCURRENT and flight['all'] >= MAX_CONCURRENT) or \
+           (expensive and MAX_CONCURRENT_EXPENSIVE and flight['expensive'] >= MAX_CONCURRENT_EXPENSIVE):
+            blocked = True
+        else:
+            blocked = False
+            flight['all'] += 1
+            if expensive: flight['expensive'] += 1
+            g._g2_admitted = (client_id, expensive)
+    if blocked:
+        _count(client_id, 'concurrency')
+        return _too_many('concurrency', '1')
+    # Admin requests (stats, bulk imports) zijn zelf geen maat voor de load van clients
+    _sampling.active = not is_admin
+    return None
+
+def _release(exc=None):
+    _sampling.active = False
+    admitted = g.pop('_g2_admitted', None)
+    if not admitted:
+        return
+    client_id, expensive = admitted
+    with _lock:
+        flight = _in_flight[client_id]
+        flight['all'] -= 1
+        if expensive: flight['expensive'] -= 1
+        if not flight['all']:
+            del _in_flight[client_id]
+
+def _rate_limited(e):
+    return jsonify({"error": "Too Many Requests", "reason": "rate", "limit": str(e.description)}), 429
+
+def init_app(app):
+    app.before_request(_admit)
+    app.teardown_request(_release)
+    app.register_error_handler(429, _rate_limited)
+    limiter.init_app(app)
+
+def stats():
+    """Snapshot van de admission status voor admin_stats."""
+    with _lock:
+        throttled = {cid: dict(c) for cid, c in _throttled.items()}
+        in_flight = {cid: dict(c) for cid, c in _in_flight.items()}
+    return {
+        'mongo_latency_ms': round(mongo_latency.avg(), 2),
+        'pool_wait_ms': round(pool_wait.avg(), 2),
+        'enabled': ADMISSION_ENABLED,
+        'load_level': load_level(),
+        'storage': RATE_STORAGE_URI.split('://')[0],
+        'throttled': throttled,
+        'in_flight': in_flight
+    }
@@ -2,33 +2,60 @@ import os
 import datetime
 import json
 import traceback
+import threading
 from functools import wraps
 from flask import Flask, request, jsonify, g, Response, send_from_directory
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from bson import ObjectId
 from file_handler import file_bp
+import admission
+from admission import limiter, client_endpoint_key
+import profiler
+from profiler import profiler_bp, span, timed
+import jobs
+from jobs import jobs_bp
+import snapshots
+from snapshots import snapshots_bp
+import ingest
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+admission.init_app(app)
 app.register_blueprint(file_bp, url_prefix='/api')
+app.register_blueprint(profiler_bp, url_prefix='/api')
+app.register_blueprint(jobs_bp, url_prefix='/api')
+app.register_blueprint(snapshots_bp, url_prefix='/api')
 
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://mongo:27017/')
+MAX_MGET_IDS = 1000
+_client = None
+_client_lock = threading.Lock()
 
+@timed('get_db')
 def get_db():
+    # Eén client (met connection pool) voor het hele proces; per request een nieuwe client
+    # betekent elke keer opnieuw verbinden, handshake en auth
+    global _client
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
-        client.admin.command('ping')
-        return client['data_store']
+        if _client is None:
+            with _client_lock:
+                if _client is None:
+                    _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+        _client.admin.command('ping')
+        return _client['data_store']
     except Exception as e:
         print(f"DB ERROR: {e}")
         return None
 
+profiler.init_app(app, get_db)
+
 # --- SYSTEM HELPERS ---
 
 def get_config(db, col_name):
     return db['_g2_config'].find_one({'_id': col_name}) or {}
 
+@timed('log_activity')
 def log_activity(db, col_name, client_id, is_error=False, error_msg=None):
     try:
         now = datetime.datetime.utcnow()
@@ -57,14 +84,62 @@ def check_lock(f):
     @wraps(f)
     def decorated_function(collection_name, *args, **kwargs):
         if request.method in ['POST', 'PUT', 'DELETE']:
+            # get_db heeft een eigen span; alleen de config lookup telt als check_lock
             db = get_db()
-            if db is not None:
-                config = get_config(db, collection_name)
-                if config.get('locked', False):
-                    return jsonify({"error": "Endpoint is LOCKED (Read-Only)"}), 403
+            with span('check_lock'):
+                locked = db is not None and get_config(db, collection_name).get('locked', False)
+            if locked:
+                return jsonify({"error": "Endpoint is LOCKED (Read-Only)"}), 403
+        return f(collection_name, *args, **kwargs)
+    return decorated_function
+
+def ingest_mode(f):
+    """
+    DECORATOR: POSTs naar een endpoint in ingest mode (zie ingest.py) worden direct
+    gebufferd en met 202 beantwoord, zonder check_lock/log_activity/insert per event.
+    """
+    @wraps(f)
+    def decorated_function(collection_name, *args, **kwargs):
+        if request.method == 'POST':
+            config = ingest.cached_config(collection_name)
+            if config.get('ingest'):
+                return accept_ingest(collection_name, config)
         return f(collection_name, *args, **kwargs)
     return decorated_function
 
+def accept_ingest(collection_name, config):
+    if config.get('locked', False):
+        return jsonify({"error": "Endpoint is LOCKED (Read-Only)"}), 403
+    raw_data = request.get_json(silent=True)
+    events = raw_data if isinstance(raw_data, list) else [raw_data or {}]
+    if len(events) > ingest.MAX_REQUEST_EVENTS:
+        return jsonify({"error": f"Max {ingest.MAX_REQUEST_EVENTS} events per request"}), 413
+    now = datetime.datetime.utcnow()
+    time_field = config.get('timeseries_field', 'ts') if config.get('timeseries') else None
+    docs = []
+    for event in events:
+        if not isinstance(event, dict):
+            return jsonify({"error": "Events moeten JSON objecten zijn"}), 400
+        doc = clean_incoming_data(event)
+        # _id alvast hier, zodat de client een id terugkrijgt zonder op de insert te wachten
+        doc['_id'] = ObjectId()
+        if time_field:
+            # Time series: _meta is het metaField en bepaalt de bucket, dus alleen de owner erin.
+            # Het tijdstip staat in het tijdveld zelf.
+            doc['_meta'] = {'owner': g.client_id}
+            try:
+                doc[time_field] = ingest.time_value(doc.get(time_field), now)
+            except ValueError:
+                return jsonify({"error": f"Invalid timestamp in '{time_field}'"}), 400
+        else:
+            doc['_meta'] = {'owner': g.client_id, 'created_at': now}
+        docs.append(doc)
+    if not ingest.enqueue(collection_name, ingest.write_concern(config), docs):
+        return jsonify({"error": "Ingest buffer vol"}), 503, {'Retry-After': '1'}
+    if isinstance(raw_data, list):
+        return jsonify({"status": "accepted", "count": len(docs), "_ids": [str(d['_id']) for d in docs]}), 202
+    return jsonify({"_id": str(docs[0]['_id']), "status": "accepted"}), 202
+
 # --- AUTH & FORMATTERS ---
 
 def require_client_id(f):
@@ -89,6 +164,8 @@ def format_doc(doc):
                     new_doc['_created_at'] = v.get('created_at').strftime('%Y-%m-%d %H:%M:%S')
                 if v.get('updated_at'):
                     new_doc['_updated_at'] = v.get('updated_at').strftime('%Y-%m-%d %H:%M:%S')
+                if v.get('version') is not None:
+                    new_doc['_version'] = v.get('version')
             else: new_doc[k] = v
         return new_doc
     return doc
@@ -97,6 +174,32 @@ def clean_incoming_data(data):
     if not isinstance(data, dict): return data
     return {k: v for k, v in data.items() if not k.startswith('_')}
 
+def parse_doc_id(doc_id):
+    try: return ObjectId(doc_id)
+    except: return doc_id
+
+# --- VERSIONING (If-Match / ETag) ---
+# Elk document heeft een versie in _meta.version die bij iedere PUT met 1 omhoog gaat.
+# Documenten van voor de versioning hebben geen veld en gelden als versie 0.
+
+def etag(doc):
+    return f'"{(doc.get("_meta") or {}).get("version", 0)}"'
+
+def if_match_version():
+    """Versie uit de If-Match header; None als die ontbreekt of '*' is, -1 als hij onleesbaar is."""
+    header = (request.headers.get('If-Match') or '').strip()
+    if not header or header == '*': return None
+    if header.startswith('W/'): header = header[2:]
+    try: return int(header.strip('"'))
+    except ValueError: return -1
+
+def version_query(version):
+    return version if version else {'$in': [0, None]}
+
+jobs.init_app(app, get_db, format_doc)
+ingest.init_app(app, MONGO_URI, log_activity)
+snapshots.init_app(app, get_db)
+
 # --- ADMIN ROUTES ---
 
 @app.route('/api/admin/stats', methods=['GET'])
@@ -104,8 +207,9 @@ def admin_stats():
     db = get_db()
     if db is None: return jsonify({'error': 'DB Offline'}), 500
     cols = db.list_collection_names()
-    ignore = ['clients', 'statistics', 'system.indexes', '_g2_config', '_g2_snapshots', '_g2_errors']
-    endpoint_names = [c for c in cols if c not in ignore]
+    ignore = ['clients', 'statistics', 'system.indexes', '_g2_config', '_g2_snapshots', '_g2_errors', '_g2_slowlog']
+    # Alles met _g2_ prefix is intern (ook tijdelijke restore collecties)
+    endpoint_names = [c for c in cols if c not in ignore and not c.startswith('_g2_')]
     endpoint_stats = []
     total_records = 0
     client_stats = []
@@ -133,7 +237,8 @@ def admin_stats():
             'size_pct': (col_sizes[col_name] / max_size) * 100,
             'last_activity': last_act.isoformat() if last_act else None,
             'locked': conf.get('locked', False),
-            'ttl': conf.get('ttl_days', 0)
+            'ttl': conf.get('ttl_days', 0),
+            'ingest': conf.get('ingest', False)
         })
 
     client_config_docs = db['_g2_config'].find({'type': 'client_stats'})
@@ -150,7 +255,8 @@ def admin_stats():
         client_stats.append({
             'client_id': cid,
             'total_records': count,
-            'last_seen': ls.isoformat() if ls else None
+            'last_seen': ls.isoformat() if ls else None,
+            'throttled': admission.throttle_counts(cid)
         })
 
     errors = list(db['_g2_errors'].find().sort('timestamp', -1).limit(10))
@@ -190,6 +296,8 @@ def admin_stats():
         'endpoints': endpoint_stats,
         'file_endpoints': file_endpoints,
         'clients': client_stats,
+        'admission': admission.stats(),
+        'ingest': ingest.stats(),
         'errors': formatted_errors,
         'db_info': {
             'data_size_mb': round(db_stats.get('dataSize', 0) / (1024*1024), 2),
@@ -312,7 +420,15 @@ def admin_settings():
     update = {}
     if 'locked' in data: update['locked'] = data['locked']
     if 'ttl_days' in data: update['ttl_days'] = int(data['ttl_days'])
+    if 'ingest' in data: update['ingest'] = bool(data['ingest'])
+    if 'ingest_w' in data:
+        w = ingest.parse_write_concern(data['ingest_w'])
+        if w is None: return jsonify({'error': "ingest_w must be 0, a positive integer or 'majority'"}), 400
+        update['ingest_w'] = w
+    if 'timeseries' in data: update['timeseries'] = bool(data['timeseries'])
+    if 'timeseries_field' in data: update['timeseries_field'] = data['timeseries_field']
     db['_g2_config'].update_one({'_id': col}, {'$set': update}, upsert=True)
+    ingest.invalidate(col)
     return jsonify({"status": "updated"})
 
 @app.route('/api/admin/cleanup', methods=['POST'])
@@ -325,7 +441,9 @@ def admin_cleanup():
         days = conf['ttl_days']
         col_name = conf['_id']
         cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
-        res = db[col_name].delete_many({'_meta.created_at': {'$lt': cutoff}})
+        # Time series collecties hebben geen _meta.created_at, daar telt het tijdveld
+        age_field = conf.get('timeseries_field', 'ts') if conf.get('timeseries') else '_meta.created_at'
+        res = db[col_name].delete_many({age_field: {'$lt': cutoff}})
         if res.deleted_count > 0:
             report.append(f"{col_name}: {res.deleted_count} items verwijderd (> {days} dagen).")
     return jsonify({"report": report})
@@ -348,15 +466,30 @@ def admin_update_record(col_name, doc_id):
     try:
         if request.method == 'PUT':
             new_doc = request.json
+            col = db[col_name]
+            query = {'_id': ObjectId(doc_id)}
+            # De nieuwe versie bepaalt de server: _version van de client is alleen de verwachte versie
+            if new_doc.get('_version') is not None:
+                expected = int(new_doc['_version'])
+            else:
+                current = col.find_one(query, {'_meta': 1})
+                if not current: return jsonify({"error": "Record not found"}), 404
+                expected = int((current.get('_meta') or {}).get('version') or 0)
             meta = {
                 'owner': new_doc.get('_client_id'),
                 'created_at': datetime.datetime.strptime(new_doc.get('_created_at'), '%Y-%m-%d %H:%M:%S') if new_doc.get('_created_at') else None,
-                'updated_at': datetime.datetime.utcnow()
+                'updated_at': datetime.datetime.utcnow(),
+                'version': expected + 1
             }
             data = clean_incoming_data(new_doc)
             data['_meta'] = meta
-            db[col_name].replace_one({'_id': ObjectId(doc_id)}, data)
-            return jsonify({"status": "saved"})
+            # Alleen vervangen als er intussen niemand anders heeft geschreven
+            result = col.replace_one({**query, '_meta.version': version_query(expected)}, data)
+            if not result.matched_count:
+                if col.count_documents(query, limit=1):
+                    return jsonify({"error": "Version mismatch"}), 409
+                return jsonify({"error": "Record not found"}), 404
+            return jsonify({"status": "saved", "_version": expected + 1})
         elif request.method == 'DELETE':
             result = db[col_name].delete_one({'_id': ObjectId(doc_id)})
             if result.deleted_count > 0:
@@ -408,6 +541,7 @@ def admin_del_col(name):
     db[name].drop(); return jsonify({"status":"deleted"})
 
 @app.route('/api/admin/export/<name>', methods=['GET'])
+@limiter.limit(admission.EXPORT_LIMIT, scope='export')
 def admin_exp(name):
     db = get_db()
     if db is None: return jsonify({'error': 'DB Offline'}), 500
@@ -424,7 +558,10 @@ def admin_peek(name):
 # --- GATEWAY ROUTES ---
 
 @app.route('/api/<collection_name>', methods=['GET', 'POST'])
+@limiter.limit(admission.RATE_LIMIT, key_func=client_endpoint_key)
+@limiter.limit(admission.FULL_READ_LIMIT, key_func=client_endpoint_key, methods=['GET'], scope='full_read')
 @require_client_id
+@ingest_mode
 @check_lock
 def api_collection(collection_name):
     db = get_db()
@@ -432,53 +569,107 @@ def api_collection(collection_name):
     try:
         if request.method == 'GET':
             log_activity(db, collection_name, g.client_id)
-            docs = list(db[collection_name].find({'_meta.owner': g.client_id}))
-            return jsonify(format_doc(docs)), 200
+            query = {'_meta.owner': g.client_id}
+            profiler.note_query(collection_name, query)
+            with span('query'):
+                docs = list(db[collection_name].find(query))
+            with span('format_doc'):
+                out = format_doc(docs)
+            with span('serialize'):
+                return jsonify(out), 200
 
         if request.method == 'POST':
             log_activity(db, collection_name, g.client_id)
             raw_data = request.get_json(silent=True) or {}
             user_data = clean_incoming_data(raw_data)
-            user_data['_meta'] = {'owner': g.client_id, 'created_at': datetime.datetime.utcnow()}
-            result = db[collection_name].insert_one(user_data)
+            user_data['_meta'] = {'owner': g.client_id, 'created_at': datetime.datetime.utcnow(), 'version': 1}
+            with span('query'):
+                result = db[collection_name].insert_one(user_data)
             return jsonify({"_id": str(result.inserted_id), "status": "created"}), 201
     except Exception as e:
         log_activity(db, collection_name, g.client_id, is_error=True, error_msg=e)
         return jsonify({"error": "Server Error"}), 500
 
+@app.route('/api/<collection_name>/_mget', methods=['POST'])
+@limiter.limit(admission.RATE_LIMIT, key_func=client_endpoint_key)
+@require_client_id
+def api_multi_get(collection_name):
+    """
+    Haalt meerdere documenten van de client op in één $in query.
+    Body: {"ids": ["...", "..."]}  ->  lijst met gevonden documenten, in de volgorde van ids
+    """
+    db = get_db()
+    if db is None: return jsonify({"error": "DB Offline"}), 503
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list):
+        return jsonify({"error": "Body moet een 'ids' lijst bevatten"}), 400
+    if len(ids) > MAX_MGET_IDS:
+        return jsonify({"error": f"Max {MAX_MGET_IDS} ids per request"}), 413
+    try:
+        log_activity(db, collection_name, g.client_id)
+        q_ids = [parse_doc_id(str(i)) for i in ids]
+        query = {'_id': {'$in': q_ids}, '_meta.owner': g.client_id}
+        profiler.note_query(collection_name, query)
+        with span('query'):
+            found = {d['_id']: d for d in db[collection_name].find(query)}
+        with span('format_doc'):
+            out = [format_doc(found[i]) for i in dict.fromkeys(q_ids) if i in found]
+        with span('serialize'):
+            return jsonify(out), 200
+    except Exception as e:
+        log_activity(db, collection_name, g.client_id, is_error=True, error_msg=e)
+        return jsonify({"error": "Server Error"}), 500
+
 @app.route('/api/<collection_name>/<doc_id>', methods=['GET', 'PUT', 'DELETE'])
+@limiter.limit(admission.RATE_LIMIT, key_func=client_endpoint_key)
 @require_client_id
 @check_lock
 def api_document(collection_name, doc_id):
     db = get_db()
     if db is None: return jsonify({"error": "DB Offline"}), 503
     try:
-        try: q_id = ObjectId(doc_id)
-        except: q_id = doc_id
-        query = {'_id': q_id, '_meta.owner': g.client_id}
+        query = {'_id': parse_doc_id(doc_id), '_meta.owner': g.client_id}
         col = db[collection_name]
+        # Met If-Match slaagt een schrijfactie alleen als de versie nog klopt
+        expected = if_match_version() if request.method in ['PUT', 'DELETE'] else None
+        write_query = query if expected is None else {**query, '_meta.version': version_query(expected)}
 
         if request.method == 'GET':
             log_activity(db, collection_name, g.client_id)
-            doc = col.find_one(query)
-            return (jsonify(format_doc(doc)), 200) if doc else (jsonify({"error": "Not found"}), 404)
+            profiler.note_query(collection_name, query)
+            with span('query'):
+                doc = col.find_one(query)
+            if not doc:
+                return jsonify({"error": "Not found"}), 404
+            with span('format_doc'):
+                out = format_doc(doc)
+            with span('serialize'):
+                return jsonify(out), 200, {'ETag': etag(doc)}
 
         if request.method == 'PUT':
             log_activity(db, collection_name, g.client_id)
             user_data = clean_incoming_data(request.get_json(silent=True) or {})
             # GECORRIGEERD: Combineer beide $set operaties in één dict
             update_payload = {**user_data, '_meta.updated_at': datetime.datetime.utcnow()}
-            res = col.update_one(query, {'$set': update_payload})
-            if res.matched_count:
-                # Haal de bijgewerkte doc op voor bevestiging
-                updated_doc = col.find_one(query)
-                return jsonify({"status": "updated", **format_doc(updated_doc)}), 200
-            else:
-                return jsonify({"status": "not found"}), 404
+            # Eén round-trip: update + de bijgewerkte doc terug voor bevestiging
+            with span('query'):
+                updated_doc = col.find_one_and_update(
+                    write_query,
+                    {'$set': update_payload, '$inc': {'_meta.version': 1}},
+                    return_document=ReturnDocument.AFTER
+                )
+            if updated_doc:
+                return jsonify({"status": "updated", **format_doc(updated_doc)}), 200, {'ETag': etag(updated_doc)}
+            if expected is not None and col.count_documents(query, limit=1):
+                return jsonify({"error": "Version mismatch"}), 412
+            return jsonify({"status": "not found"}), 404
 
         if request.method == 'DELETE':
             log_activity(db, collection_name, g.client_id)
-            res = col.delete_one(query)
+            with span('query'):
+                res = col.delete_one(write_query)
+            if not res.deleted_count and expected is not None and col.count_documents(query, limit=1):
+                return jsonify({"error": "Version mismatch"}), 412
             return jsonify({"status": "deleted" if res.deleted_count else "not found"}), 200
 
     except Exception as e:
@@ -0,0 +1,442 @@
+"""
+Benchmark / load-test harness voor de G2 gateway.
+
+Draait realistische load profielen tegen de gateway, admin en file routes en
+schrijft throughput, p50/p99 latency (alleen geslaagde requests), fouten per
+statuscode en piek RSS weg als JSON, zodat builds onderling vergeleken kunnen worden.
+
+Voorbeelden:
+    # In-process (Flask test client, geen HTTP laag) tegen een lokale mongod
+    python benchmark.py --mongo-uri mongodb://localhost:27017/
+
+    # In-process tegen een tijdelijke mongod (vereist: pip install pymongo_inmemory)
+    python benchmark.py --inmemory
+
+    # Tegen een draaiende gateway (seeding gaat dan direct via --mongo-uri);
+    # --gateway-pid meet de piek RSS van het gateway proces, zonder blijft peak_rss_mb null
+    python benchmark.py --url http://localhost:5000 --mongo-uri mongodb://localhost:27017/ --gateway-pid 1234
+
+    # Vergelijk met een eerdere run
+    python benchmark.py --inmemory --output new.json --compare old.json
+"""
+import os
+import io
+import sys
+import math
+import json
+import time
+import random
+import shutil
+import argparse
+import datetime
+import platform
+import resource
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_COLLECTION = 'bench_items'
+BENCH_IMPORT_COLLECTION = 'bench_import'
+BENCH_FILE_ENDPOINT = 'bench_files'
+ALL_PROFILES = ['read_poll', 'write_burst', 'bulk_import', 'big_export', 'dashboard_refresh', 'file_rw']
+
+# --- CLIENTS ---
+
+class InProcessClient:
+    """Roept de Flask app direct aan via de test client (geen netwerk, geen WSGI server)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json_body=None, data=None):
+        kwargs = {'headers': headers or {}}
+        if json_body is not None: kwargs['json'] = json_body
+        if data is not None:
+            kwargs['data'] = data
+            kwargs['content_type'] = 'multipart/form-data'
+        res = self.client.open(path, method=method, **kwargs)
+        return res.status_code, res.get_data()
+
+class HttpClient:
+    """Praat via HTTP met een draaiende gateway."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, headers=None, json_body=None, data=None):
+        headers = dict(headers or {})
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        if data is not None:
+            body, headers['Content-Type'] = _encode_multipart(data)
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=60) as res:
+                return res.status, res.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+def _encode_multipart(data):
+    boundary = f"g2bench{random.getrandbits(64):x}"
+    out = io.BytesIO()
+    for name, (fileobj, filename) in data.items():
+        out.write(f"--{boundary}\r\n".encode())
+        out.write(f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode())
+        out.write(b"Content-Type: application/octet-stream\r\n\r\n")
+        out.write(fileobj.read())
+        out.write(b"\r\n")
+    out.write(f"--{boundary}--\r\n".encode())
+    return out.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+# --- SEEDING ---
+
+def make_record(rng):
+    return {
+        'title': f"item {rng.randint(0, 10**6)}",
+        'status': rng.choice(['open', 'done', 'archived']),
+        'score': rng.random() * 100,
+        'tags': rng.sample(['a', 'b', 'c', 'd', 'e', 'f'], 3),
+        'body': 'x' * rng.randint(50, 500)
+    }
+
+def seed_database(db, owners, records, rng):
+    """Vult de bench collecties direct via pymongo (sneller dan via de gateway)."""
+    db[BENCH_COLLECTION].drop()
+    db[BENCH_IMPORT_COLLECTION].drop()
+    ids = []
+    batch = []
+    now = datetime.datetime.utcnow()
+    for i in range(records):
+        owner = owners[i % len(owners)]
+        rec = make_record(rng)
+        rec['_meta'] = {'owner': owner, 'created_at': now}
+        batch.append(rec)
+        if len(batch) == 5000:
+            res = db[BENCH_COLLECTION].insert_many(batch)
+            ids.extend(zip(res.inserted_ids, [b['_meta']['owner'] for b in batch]))
+            batch = []
+    if batch:
+        res = db[BENCH_COLLECTION].insert_many(batch)
+        ids.extend(zip(res.inserted_ids, [b['_meta']['owner'] for b in batch]))
+    return [(str(i), o) for i, o in ids]
+
+def seed_files(client, owners, files, file_kb, rng):
+    """Uploadt bestanden via de file blueprint, zodat ook de upload route gemeten wordt."""
+    names = []
+    payload = os.urandom(file_kb * 1024)
+    for i in range(files):
+        owner = owners[i % len(owners)]
+        filename = f"seed_{i}.bin"
+        client.request('POST', f"/api/{BENCH_FILE_ENDPOINT}/files", headers={'x-client-id': owner},
+                       data={'file': (io.BytesIO(payload), filename)})
+        names.append((filename, owner))
+    return names
+
+# --- PROFIELEN ---
+# Elk profiel is een functie (client, ctx, rng) -> status code
+
+def op_read_poll(client, ctx, rng):
+    if rng.random() < 0.5:
+        owner = rng.choice(ctx['owners'])
+        status, _ = client.request('GET', f"/api/{BENCH_COLLECTION}", headers={'x-client-id': owner})
+    else:
+        doc_id, owner = rng.choice(ctx['ids'])
+        status, _ = client.request('GET', f"/api/{BENCH_COLLECTION}/{doc_id}", headers={'x-client-id': owner})
+    return status
+
+def op_write_burst(client, ctx, rng):
+    if rng.random() < 0.7:
+        owner = rng.choice(ctx['owners'])
+        status, _ = client.request('POST', f"/api/{BENCH_COLLECTION}", headers={'x-client-id': owner},
+                                   json_body=make_record(rng))
+    else:
+        doc_id, owner = rng.choice(ctx['ids'])
+        status, _ = client.request('PUT', f"/api/{BENCH_COLLECTION}/{doc_id}", headers={'x-client-id': owner},
+                                   json_body={'status': rng.choice(['open', 'done'])})
+    return status
+
+def op_bulk_import(client, ctx, rng):
+    records = [make_record(rng) for _ in range(ctx['import_size'])]
+    status, _ = client.request('POST', '/api/admin/import',
+                               json_body={'collection': BENCH_IMPORT_COLLECTION, 'records': records,
+                                          'owner': rng.choice(ctx['owners'])})
+    return status
+
+def op_big_export(client, ctx, rng):
+    status, _ = client.request('GET', f"/api/admin/export/{BENCH_COLLECTION}")
+    return status
+
+def op_dashboard_refresh(client, ctx, rng):
+    status, _ = client.request('GET', '/api/admin/stats')
+    return status
+
+def op_file_rw(client, ctx, rng):
+    if rng.random() < 0.3:
+        owner = rng.choice(ctx['owners'])
+        status, _ = client.request('POST', f"/api/{BENCH_FILE_ENDPOINT}/files", headers={'x-client-id': owner},
+                                   data={'file': (io.BytesIO(ctx['file_payload']), f"load_{rng.randint(0, 999)}.bin")})
+    else:
+        filename, owner = rng.choice(ctx['files'])
+        status, _ = client.request('GET', f"/api/{BENCH_FILE_ENDPOINT}/files/{filename}?client_id={owner}")
+    return status
+
+PROFILE_OPS = {
+    'read_poll': op_read_poll,
+    'write_burst': op_write_burst,
+    'bulk_import': op_bulk_import,
+    'big_export': op_big_export,
+    'dashboard_refresh': op_dashboard_refresh,
+    'file_rw': op_file_rw,
+}
+
+# --- METING ---
+
+def current_rss_mb(pid='self'):
+    """RSS van een proces via /proc; None als een ander proces niet (meer) te lezen is."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid != 'self':
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class RssSampler:
+    """Houdt in een achtergrond thread de piek RSS van een proces bij gedurende een profiel."""
+
+    def __init__(self, pid='self', interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = current_rss_mb(self.pid)
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+def percentile(sorted_values, pct):
+    if not sorted_values: return None
+    # Nearest-rank methode
+    k = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def run_profile(name, make_client, ctx, concurrency, duration, seed, rss_pid='self'):
+    op = PROFILE_OPS[name]
+    deadline = time.perf_counter() + duration
+
+    def worker(idx):
+        client = make_client()
+        rng = random.Random(seed + idx)
+        latencies, errors = [], {}
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = op(client, ctx, rng)
+            except Exception:
+                status = 599
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            # Alleen geslaagde requests tellen mee: snelle 429/503's laten een build anders sneller lijken
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+            else:
+                latencies.append(elapsed_ms)
+        return latencies, errors
+
+    # rss_pid None: er valt niets zinnigs te meten (http mode zonder --gateway-pid)
+    with RssSampler(rss_pid or 'self') as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for lat, _ in results for l in lat)
+    errors_by_status = {}
+    for _, errs in results:
+        for status, n in errs.items():
+            errors_by_status[str(status)] = errors_by_status.get(str(status), 0) + n
+    return {
+        'profile': name,
+        'concurrency': concurrency,
+        'requests': len(latencies) + sum(errors_by_status.values()),
+        'ok': len(latencies),
+        'errors': sum(errors_by_status.values()),
+        'errors_by_status': errors_by_status,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+        'peak_rss_mb': round(rss.peak, 1) if rss_pid and rss.peak is not None else None
+    }
+
+def compare(results, baseline_path):
+    """Print per profiel het verschil met een eerdere run."""
+    with open(baseline_path) as f:
+        baseline = {r['profile']: r for r in json.load(f)['results']}
+    print(f"\n{'profiel':<20}{'rps':>18}{'p50 ms':>18}{'p99 ms':>18}{'rss mb':>18}")
+    for r in results:
+        b = baseline.get(r['profile'])
+        if not b: continue
+        cells = []
+        for key in ['throughput_rps', 'p50_ms', 'p99_ms', 'peak_rss_mb']:
+            old, new = b.get(key), r.get(key)
+            delta = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else 'n/a'
+            cells.append(f"{new} ({delta})")
+        print(f"{r['profile']:<20}" + ''.join(f"{c:>18}" for c in cells))
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+# --- MAIN ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="G2 gateway benchmark")
+    parser.add_argument('--url', help="Base URL van een draaiende gateway; zonder --url draait de app in-process")
+    parser.add_argument('--gateway-pid', type=int,
+                        help="PID van de gateway bij --url, om de piek RSS van dat proces te meten")
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--inmemory', action='store_true', help="Start een tijdelijke mongod via pymongo_inmemory")
+    parser.add_argument('--profiles', default=','.join(ALL_PROFILES))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconden per profiel")
+    parser.add_argument('--owners', type=int, default=200)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--file-kb', type=int, default=64)
+    parser.add_argument('--import-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="Eerdere JSON output om mee te vergelijken")
+    parser.add_argument('--admission', action='store_true',
+                        help="Rate limits en load shedding aan laten (alleen in-process); standaard uit, "
+                             "anders meten de dure profielen vooral snelle 429's")
+    parser.add_argument('--keep', action='store_true', help="Bench data na afloop niet opruimen")
+    args = parser.parse_args(argv)
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    unknown = [p for p in profiles if p not in PROFILE_OPS]
+    if unknown:
+        parser.error(f"Onbekende profielen: {', '.join(unknown)}")
+    if args.gateway_pid and not args.url:
+        parser.error("--gateway-pid werkt alleen samen met --url")
+    if args.gateway_pid and current_rss_mb(args.gateway_pid) is None:
+        parser.error(f"Kan /proc/{args.gateway_pid}/status niet lezen")
+
+    inmemory = None
+    if args.inmemory:
+        try:
+            from pymongo_inmemory.mongod import Mongod
+            from pymongo_inmemory.context import Context
+        except ImportError:
+            parser.error("--inmemory vereist 'pip install pymongo_inmemory'")
+        inmemory = Mongod(Context())
+        inmemory.start()
+        args.mongo_uri = inmemory.connection_string
+        if args.url:
+            print("Let op: --inmemory met --url werkt alleen als de gateway dezelfde mongod gebruikt.")
+
+    # app.py leest MONGO_URI bij het importeren, dus eerst de omgeving zetten
+    os.environ['MONGO_URI'] = args.mongo_uri
+    if not args.url:
+        os.environ['G2_ADMISSION_ENABLED'] = '1' if args.admission else '0'
+    from pymongo import MongoClient
+
+    try:
+        if args.url:
+            make_client = lambda: HttpClient(args.url)
+        else:
+            from app import app
+            make_client = lambda: InProcessClient(app)
+
+        rng = random.Random(args.seed)
+        db = MongoClient(args.mongo_uri)['data_store']
+        owners = [f"bench_owner_{i}" for i in range(args.owners)]
+        print(f"Seeding {args.records} records voor {args.owners} owners...")
+        ids = seed_database(db, owners, args.records, rng)
+        files = []
+        if 'file_rw' in profiles and args.files:
+            print(f"Seeding {args.files} bestanden van {args.file_kb} KB...")
+            files = seed_files(make_client(), owners, args.files, args.file_kb, rng)
+
+        ctx = {
+            'owners': owners,
+            'ids': ids,
+            'files': files,
+            'import_size': args.import_size,
+            'file_payload': os.urandom(args.file_kb * 1024)
+        }
+
+        # In-process meet de eigen RSS (gateway + harness); via http alleen het opgegeven gateway proces
+        rss_pid = (args.gateway_pid or None) if args.url else 'self'
+        results = []
+        for i, name in enumerate(profiles):
+            print(f"Profiel {name} ({args.concurrency} workers, {args.duration}s)...")
+            r = run_profile(name, make_client, ctx, args.concurrency, args.duration, args.seed + i * 1000,
+                            rss_pid=rss_pid)
+            print(f"  {r['throughput_rps']} req/s, p50 {r['p50_ms']} ms, p99 {r['p99_ms']} ms, "
+                  f"errors {r['errors_by_status'] or 0}, rss {r['peak_rss_mb']} MB")
+            results.append(r)
+
+        output = {
+            'meta': {
+                'timestamp': datetime.datetime.utcnow().isoformat(),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'mode': 'http' if args.url else 'in-process',
+                'admission': args.admission if not args.url else None,
+                'rss_scope': ('gateway' if rss_pid else None) if args.url else 'gateway+harness',
+                'args': vars(args)
+            },
+            'results': results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"Resultaten geschreven naar {args.output}")
+
+        if args.compare:
+            compare(results, args.compare)
+
+        if not args.keep:
+            db[BENCH_COLLECTION].drop()
+            db[BENCH_IMPORT_COLLECTION].drop()
+            db['_g2_config'].delete_many({'$or': [
+                {'_id': {'$in': [BENCH_COLLECTION, BENCH_IMPORT_COLLECTION]}},
+                {'client_id': {'$in': owners}}
+            ]})
+            if not args.url:
+                from file_handler import UPLOAD_FOLDER
+                shutil.rmtree(os.path.join(UPLOAD_FOLDER, BENCH_FILE_ENDPOINT), ignore_errors=True)
+    finally:
+        if inmemory is not None:
+            inmemory.stop()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,7 @@ import os
 import datetime
 from flask import Blueprint, request, jsonify, send_from_directory, current_app, url_for
 from werkzeug.utils import secure_filename
+from admission import limiter, client_key, client_endpoint_key, RATE_LIMIT, UPLOAD_LIMIT
 
 # Maak een Blueprint aan
 file_bp = Blueprint('file_handler', __name__)
@@ -18,6 +19,7 @@ def allowed_file(filename):
     return '.' in filename
 
 @file_bp.route('/<ep_name>/files', methods=['POST'])
+@limiter.limit(UPLOAD_LIMIT, key_func=client_key, scope='upload')
 def upload_file(ep_name):
     """
     Endpoint om een bestand te uploaden voor een specifieke endpoint/collectie.
@@ -69,6 +71,7 @@ def upload_file(ep_name):
             return jsonify({"error": str(e)}), 500
 
 @file_bp.route('/<ep_name>/files/<path:filename>', methods=['GET'])
+@limiter.limit(RATE_LIMIT, key_func=client_endpoint_key)
 def get_file(ep_name, filename):
     """
     Endpoint om een bestand op te halen voor een specifieke endpoint en client.
@@ -85,6 +88,7 @@ def get_file(ep_name, filename):
         return jsonify({"error": "File not found"}), 404
 
 @file_bp.route('/<ep_name>/files/<path:filename>', methods=['DELETE'])
+@limiter.limit(RATE_LIMIT, key_func=client_endpoint_key)
 def delete_file(ep_name, filename):
     """
     Endpoint om een bestand te verwijderen.
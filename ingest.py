@@ -0,0 +1,264 @@
+import os
+import time
+import atexit
+import datetime
+import threading
+from collections import deque
+from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import (BulkWriteError, CollectionInvalid, AutoReconnect, NetworkTimeout,
+                            ServerSelectionTimeoutError, PyMongoError)
+
+# Ingest mode: append-only endpoints (telemetry, events) waarvan POSTs direct met 202
+# worden beantwoord en in een begrensde buffer belanden. Een achtergrond thread schrijft
+# de buffer weg met grote unordered insert_many calls.
+#
+# Per endpoint in _g2_config:
+#   ingest: true              endpoint staat in ingest mode
+#   ingest_w: 0|1|"majority"  write concern voor de flush (standaard 1)
+#   timeseries: true          collectie aanmaken als time series (MongoDB 5.0+)
+#   timeseries_field: "ts"    tijdveld van de time series (standaard "ts")
+BUFFER_SIZE = int(os.environ.get('G2_INGEST_BUFFER_SIZE', '50000'))
+FLUSH_BATCH = int(os.environ.get('G2_INGEST_FLUSH_BATCH', '5000'))
+FLUSH_INTERVAL = float(os.environ.get('G2_INGEST_FLUSH_INTERVAL_MS', '200')) / 1000
+MAX_REQUEST_EVENTS = int(os.environ.get('G2_INGEST_MAX_BATCH', '5000'))
+CONFIG_TTL = float(os.environ.get('G2_INGEST_CONFIG_TTL_S', '5'))
+# Backoff per endpoint na een tijdelijke fout (Mongo onbereikbaar, failover, timeout)
+RETRY_MIN_S = float(os.environ.get('G2_INGEST_RETRY_MIN_MS', '500')) / 1000
+RETRY_MAX_S = float(os.environ.get('G2_INGEST_RETRY_MAX_MS', '30000')) / 1000
+# Zo vaak opnieuw als de write concern niet gehaald wordt; daarna tellen de events als 'unconfirmed'
+WC_RETRIES = int(os.environ.get('G2_INGEST_WC_RETRIES', '3'))
+
+_client = None
+_mongo_uri = None
+_log_activity = None
+_buffer = deque()
+_cond = threading.Condition()
+_config_cache = {}
+_timeseries_ready = set()
+_flusher = None
+_pending = 0  # uit de buffer gehaald maar nog niet weggeschreven; telt mee voor BUFFER_SIZE
+_retries = {}  # (col_name, w) -> {'at': monotonic, 'attempt': n, 'docs': [...]}, docs tellen mee in _pending
+_stats = {'accepted': 0, 'rejected': 0, 'flushed': 0, 'failed': 0, 'retried': 0, 'unconfirmed': 0}
+
+def init_app(app, mongo_uri, log_activity):
+    global _mongo_uri, _log_activity
+    _mongo_uri = mongo_uri
+    _log_activity = log_activity
+
+def _db():
+    """Eén blijvende client voor ingest; aanmaken per flush zou de winst weer tenietdoen."""
+    global _client
+    if _client is None:
+        _client = MongoClient(_mongo_uri, serverSelectionTimeoutMS=2000)
+    return _client['data_store']
+
+# --- CONFIG CACHE ---
+
+def cached_config(col_name):
+    """_g2_config met een korte TTL, zodat de ingest route niet per request Mongo hoeft te lezen."""
+    now = time.monotonic()
+    hit = _config_cache.get(col_name)
+    if hit and hit[0] > now:
+        return hit[1]
+    try:
+        conf = _db()['_g2_config'].find_one({'_id': col_name}) or {}
+    except Exception:
+        # Mongo onbereikbaar: val terug op de normale (synchrone) route
+        conf = {}
+    _config_cache[col_name] = (now + CONFIG_TTL, conf)
+    return conf
+
+def invalidate(col_name):
+    _config_cache.pop(col_name, None)
+
+def parse_write_concern(value):
+    """0, een positief getal of "majority"; None als de waarde ongeldig is."""
+    if isinstance(value, str) and value.isdigit(): value = int(value)
+    if value == 'majority' or (isinstance(value, int) and not isinstance(value, bool) and value >= 0):
+        return value
+    return None
+
+def write_concern(conf):
+    w = parse_write_concern(conf.get('ingest_w', 1))
+    return 1 if w is None else w
+
+# --- BUFFER ---
+
+def enqueue(col_name, w, docs):
+    """Zet events in de buffer; False als ze er niet (allemaal) in passen."""
+    with _cond:
+        if len(_buffer) + _pending + len(docs) > BUFFER_SIZE:
+            _stats['rejected'] += len(docs)
+            return False
+        for doc in docs:
+            _buffer.append((col_name, w, doc))
+        _stats['accepted'] += len(docs)
+        if len(_buffer) >= FLUSH_BATCH:
+            _cond.notify()
+    _ensure_flusher()
+    return True
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        with _cond:
+            if _flusher is None or not _flusher.is_alive():
+                _flusher = threading.Thread(target=_flush_loop, name='g2-ingest', daemon=True)
+                _flusher.start()
+
+def _flush_loop():
+    while True:
+        with _cond:
+            if len(_buffer) < FLUSH_BATCH:
+                _cond.wait(FLUSH_INTERVAL)
+        flush()
+
+def flush(force=False):
+    """
+    Schrijft de buffer weg in batches van FLUSH_BATCH, plus de groepen waarvan de backoff voorbij is
+    (met force=True alle groepen). Elke (endpoint, write concern) groep wordt apart geschreven,
+    zodat een endpoint met problemen de rest niet ophoudt.
+    Geeft False terug als er nog groepen op een nieuwe poging wachten.
+    """
+    global _pending
+    _retry_due(force)
+    while True:
+        with _cond:
+            if not _buffer:
+                break
+            items = [_buffer.popleft() for _ in range(min(FLUSH_BATCH, len(_buffer)))]
+            _pending += len(items)
+        groups = {}
+        for col_name, w, doc in items:
+            groups.setdefault((col_name, w), []).append(doc)
+        for key, docs in groups.items():
+            with _cond:
+                waiting = _retries.get(key)
+                if waiting:
+                    # Groep zit in backoff: aansluiten achter de wachtende events i.p.v. Mongo opnieuw te belasten
+                    waiting['docs'] += docs
+            if not waiting:
+                _attempt(key, docs, 0)
+    with _cond:
+        return not _retries
+
+def _retry_due(force):
+    now = time.monotonic()
+    with _cond:
+        due = {key: r for key, r in _retries.items() if force or r['at'] <= now}
+        for key in due:
+            del _retries[key]
+    for key, r in due.items():
+        _attempt(key, r['docs'], r['attempt'])
+
+def _attempt(key, docs, attempt):
+    global _pending
+    retry = _write(key[0], key[1], docs, attempt)
+    with _cond:
+        # Plek voor retries was al gereserveerd via _pending, dus dit blijft binnen BUFFER_SIZE
+        _pending -= len(docs) - len(retry)
+        if retry:
+            _stats['retried'] += len(retry)
+            delay = min(RETRY_MAX_S, RETRY_MIN_S * 2 ** min(attempt, 16))
+            _retries[key] = {'at': time.monotonic() + delay, 'attempt': attempt + 1, 'docs': retry}
+
+def _already_written(error):
+    # Duplicate _id: een eerdere poging is toch aangekomen (de _id wordt al bij accept toegekend)
+    return error.get('code') == 11000 and (error.get('keyPattern') or {'_id': 1}) == {'_id': 1}
+
+def _transient(e):
+    """Fouten waarbij dezelfde write later wel kan lukken; de rest (config, validatie, versie) niet."""
+    if isinstance(e, (AutoReconnect, NetworkTimeout, ServerSelectionTimeoutError)):
+        return True
+    return isinstance(e, PyMongoError) and e.has_error_label('RetryableWriteError')
+
+def _write(col_name, w, docs, attempt=0):
+    """
+    Schrijft één groep events weg en geeft terug wat opnieuw geprobeerd moet worden.
+    De events zijn al met 202 bevestigd: alleen bij tijdelijke fouten gaan ze terug,
+    wat Mongo blijvend weigert wordt gelogd en geteld als 'failed'.
+    """
+    db = None
+    try:
+        db = _db()
+        conf = cached_config(col_name)
+        if conf.get('timeseries'):
+            _ensure_timeseries(db, col_name, conf)
+        col = db.get_collection(col_name, write_concern=WriteConcern(w=w))
+        col.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Unordered insert: per document geschreven of geweigerd
+        rejected = {err['index'] for err in e.details.get('writeErrors', []) if not _already_written(err)}
+        if rejected:
+            _stats['failed'] += len(rejected)
+            _log_activity(db, col_name, None, is_error=True, error_msg=f"Ingest: {len(rejected)} events geweigerd")
+        docs = [d for i, d in enumerate(docs) if i not in rejected]
+        if e.details.get('writeConcernErrors'):
+            if attempt < WC_RETRIES:
+                # Geschreven maar write concern niet gehaald (bv. failover): opnieuw, duplicates tellen dan als geschreven
+                return docs
+            # Blijvend niet gehaald: de events staan wel op de primary, nog eens proberen helpt niet
+            _stats['unconfirmed'] += len(docs)
+            _log_activity(db, col_name, None, is_error=True,
+                          error_msg=f"Ingest: write concern niet gehaald voor {len(docs)} events")
+    except Exception as e:
+        if _transient(e):
+            print(f"INGEST RETRY: {e}")
+            return docs
+        _stats['failed'] += len(docs)
+        print(f"INGEST ERROR: {e}")
+        if db is not None:
+            _log_activity(db, col_name, None, is_error=True, error_msg=f"Ingest: {len(docs)} events verloren: {e}")
+        return []
+    _stats['flushed'] += len(docs)
+    # Eén keer per flush i.p.v. per event
+    for client_id in {d['_meta']['owner'] for d in docs}:
+        _log_activity(db, col_name, client_id)
+    return []
+
+def _ensure_timeseries(db, col_name, conf):
+    if col_name in _timeseries_ready:
+        return
+    # metaField bepaalt de bucket: daarom staat in _meta van een time series event alleen de owner
+    try:
+        db.create_collection(col_name, timeseries={
+            'timeField': conf.get('timeseries_field', 'ts'),
+            'metaField': '_meta'
+        })
+    except CollectionInvalid:
+        # Bestaat al (als time series of als gewone collectie); dan schrijven we er gewoon in
+        pass
+    _timeseries_ready.add(col_name)
+
+def parse_time(value):
+    """ISO tijdstip naar een naive UTC datetime; ValueError als het niet te lezen is."""
+    # fromisoformat kent de 'Z' suffix pas sinds Python 3.11
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def time_value(value, received_at):
+    """
+    Tijdveld voor time series: datetime of ISO string van de client, zonder waarde de ontvangsttijd.
+    Een onleesbaar tijdstip geeft een ValueError in plaats van stilletjes de ontvangsttijd.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if value is None:
+        return received_at
+    if isinstance(value, str):
+        return parse_time(value)
+    raise ValueError(f"Ongeldig tijdstip: {value!r}")
+
+def stats():
+    with _cond:
+        buffered = len(_buffer) + _pending
+        retrying = len(_retries)
+    return {'buffered': buffered, 'capacity': BUFFER_SIZE, 'retrying_groups': retrying, **_stats}
+
+# Bij netjes afsluiten de buffer nog wegschrijven
+atexit.register(flush, force=True)
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import uuid
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, send_from_directory
+from admission import limiter, EXPORT_LIMIT
+
+# Blueprint voor de admin job queue
+jobs_bp = Blueprint('jobs', __name__)
+
+# Configuratie
+# G2_JOB_WORKERS: aantal jobs dat tegelijk mag draaien
+# G2_JOB_MAX_QUEUED: maximaal aantal openstaande (queued + running) jobs, daarboven 429
+# G2_JOB_BATCH_SIZE: aantal documenten per batch bij clear en export
+# G2_JOB_MAX_DOCS_PER_SEC: rem op batch jobs zodat Mongo niet volloopt (0 = geen limiet)
+MAX_WORKERS = int(os.environ.get('G2_JOB_WORKERS', '2'))
+MAX_QUEUED = int(os.environ.get('G2_JOB_MAX_QUEUED', '20'))
+BATCH_SIZE = int(os.environ.get('G2_JOB_BATCH_SIZE', '1000'))
+MAX_DOCS_PER_SEC = float(os.environ.get('G2_JOB_MAX_DOCS_PER_SEC', '0'))
+HISTORY_SIZE = 100
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORT_FOLDER = os.path.join(BASE_DIR, 'exports')
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='g2-job')
+_jobs = {}
+_lock = threading.Lock()
+_get_db = None
+_format_doc = None
+
+class JobCancelled(Exception):
+    pass
+
+def init_app(app, get_db, format_doc):
+    global _get_db, _format_doc
+    _get_db = get_db
+    _format_doc = format_doc
+
+# --- JOB HELPERS ---
+
+def _public(job):
+    return {k: v for k, v in job.items() if not k.startswith('_')}
+
+def _prune():
+    """Houdt alleen de laatste HISTORY_SIZE afgeronde jobs bij (roep aan met _lock)."""
+    finished = [j for j in _jobs.values() if j['status'] in ('done', 'failed', 'cancelled')]
+    finished.sort(key=lambda j: j['created_at'])
+    for job in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+        path = job['_export_path']
+        if path and os.path.exists(path):
+            os.remove(path)
+        del _jobs[job['id']]
+
+class JobContext:
+    """Wordt aan een job functie meegegeven voor voortgang, annulering en rate limiting."""
+
+    def __init__(self, job):
+        self.job = job
+        self._started = time.monotonic()
+
+    def set_total(self, total):
+        self.job['total'] = total
+
+    def advance(self, n):
+        job = self.job
+        job['processed'] += n
+        if job['total']:
+            job['progress'] = min(100, round(job['processed'] / job['total'] * 100, 1))
+        self.check()
+        if MAX_DOCS_PER_SEC > 0:
+            # Slaap tot het gemiddelde tempo weer onder de limiet zit
+            ahead = job['processed'] / MAX_DOCS_PER_SEC - (time.monotonic() - self._started)
+            if ahead > 0:
+                self.job['_cancel'].wait(ahead)
+                self.check()
+
+    def check(self):
+        if self.job['_cancel'].is_set():
+            raise JobCancelled()
+
+def _run(job, func):
+    if job['_cancel'].is_set():
+        job['status'] = 'cancelled'
+        job['finished_at'] = datetime.datetime.utcnow().isoformat()
+        return
+    job['status'] = 'running'
+    job['started_at'] = datetime.datetime.utcnow().isoformat()
+    try:
+        db = _get_db()
+        if db is None:
+            raise RuntimeError('DB Offline')
+        job['result'] = func(db, JobContext(job), **job['params'])
+        job['progress'] = 100
+        job['status'] = 'done'
+    except JobCancelled:
+        job['status'] = 'cancelled'
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    finally:
+        job['finished_at'] = datetime.datetime.utcnow().isoformat()
+
+def submit(job_type, **params):
+    """Zet een job in de queue; geeft None terug als de queue vol zit."""
+    func = JOB_TYPES[job_type]
+    with _lock:
+        open_jobs = sum(1 for j in _jobs.values() if j['status'] in ('queued', 'running'))
+        if open_jobs >= MAX_QUEUED:
+            return None
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'params': params,
+            'status': 'queued',
+            'progress': 0,
+            'processed': 0,
+            'total': None,
+            'result': None,
+            'error': None,
+            'created_at': datetime.datetime.utcnow().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            '_cancel': threading.Event(),
+            '_export_path': None
+        }
+        _jobs[job['id']] = job
+        _prune()
+        job['_future'] = _executor.submit(_run, job, func)
+    return job
+
+# --- JOB TYPES ---
+
+def job_clone(db, ctx, source, destination):
+    """Server-side kopie via $out; één enkele operatie, dus alleen annuleerbaar zolang hij in de queue staat."""
+    ctx.set_total(db[source].estimated_document_count())
+    db[source].aggregate([{"$match": {}}, {"$out": destination}])
+    return {'source': source, 'destination': destination}
+
+def job_rename(db, ctx, source, destination):
+    """Atomaire rename via renameCollection, er wordt niets gekopieerd."""
+    db[source].rename(destination)
+    return {'source': source, 'destination': destination}
+
+def job_clear(db, ctx, collection):
+    """Wist een collectie in batches, zodat voortgang zichtbaar is en de job te annuleren is."""
+    col = db[collection]
+    ctx.set_total(col.estimated_document_count())
+    deleted = 0
+    while True:
+        ids = [d['_id'] for d in col.find({}, {'_id': 1}).limit(BATCH_SIZE)]
+        if not ids:
+            break
+        n = col.delete_many({'_id': {'$in': ids}}).deleted_count
+        deleted += n
+        ctx.advance(n)
+    return {'deleted': deleted}
+
+def job_drop(db, ctx, collection):
+    db[collection].drop()
+    return {'status': 'deleted'}
+
+def job_export(db, ctx, collection):
+    """Streamt de collectie naar een JSON bestand op schijf; geheugengebruik blijft per batch begrensd."""
+    if not os.path.exists(EXPORT_FOLDER):
+        os.makedirs(EXPORT_FOLDER)
+    col = db[collection]
+    ctx.set_total(col.estimated_document_count())
+    filename = f"{ctx.job['id']}.json"
+    path = os.path.join(EXPORT_FOLDER, filename)
+    ctx.job['_export_path'] = path
+    count = 0
+    try:
+        with open(path, 'w') as f:
+            f.write('[')
+            pending = 0
+            for doc in col.find({}, batch_size=BATCH_SIZE):
+                if count: f.write(',')
+                f.write(json.dumps(_format_doc(doc), default=str))
+                count += 1
+                pending += 1
+                if pending == BATCH_SIZE:
+                    ctx.advance(pending)
+                    pending = 0
+            f.write(']')
+    except JobCancelled:
+        os.remove(path)
+        ctx.job['_export_path'] = None
+        raise
+    ctx.job['processed'] = count
+    return {'count': count, 'download_url': f"/api/admin/jobs/{ctx.job['id']}/download"}
+
+JOB_TYPES = {
+    'clone': job_clone,
+    'rename': job_rename,
+    'clear': job_clear,
+    'drop': job_drop,
+    'export': job_export,
+}
+
+# Verplichte parameters per job type
+JOB_PARAMS = {
+    'clone': ['source', 'destination'],
+    'rename': ['source', 'destination'],
+    'clear': ['collection'],
+    'drop': ['collection'],
+    'export': ['collection'],
+}
+
+# Optionele parameters per job type
+JOB_OPTIONAL_PARAMS = {}
+
+def register(job_type, func, required, optional=()):
+    """Laat andere modules (bv. snapshots) hun eigen job types toevoegen."""
+    JOB_TYPES[job_type] = func
+    JOB_PARAMS[job_type] = list(required)
+    JOB_OPTIONAL_PARAMS[job_type] = list(optional)
+
+def submit_response(job_type, **params):
+    """Submit + het standaard HTTP antwoord (202 met de job, of 429 als de queue vol zit)."""
+    job = submit(job_type, **params)
+    if job is None:
+        return jsonify({'error': 'Te veel openstaande jobs'}), 429, {'Retry-After': '5'}
+    return jsonify(_public(job)), 202
+
+# --- ADMIN ROUTES ---
+
+@jobs_bp.route('/admin/jobs', methods=['POST'])
+@limiter.limit(EXPORT_LIMIT, scope='export',
+               exempt_when=lambda: (request.get_json(silent=True) or {}).get('type') != 'export')
+def admin_submit_job():
+    """
+    (ADMIN) Start een achtergrond job.
+    Body: {"type": "clone|rename|clear|drop|export|...", ...parameters}
+    """
+    data = request.json or {}
+    job_type = data.get('type')
+    if job_type not in JOB_TYPES:
+        return jsonify({'error': f"Onbekend job type: {job_type}"}), 400
+    params = {}
+    for name in JOB_PARAMS[job_type]:
+        if not data.get(name):
+            return jsonify({'error': f"Parameter '{name}' ontbreekt"}), 400
+        params[name] = data[name]
+    for name in JOB_OPTIONAL_PARAMS.get(job_type, []):
+        if data.get(name) is not None:
+            params[name] = data[name]
+    return submit_response(job_type, **params)
+
+@jobs_bp.route('/admin/jobs', methods=['GET'])
+def admin_list_jobs():
+    """(ADMIN) Alle bekende jobs, nieuwste eerst."""
+    with _lock:
+        jobs = sorted(_jobs.values(), key=lambda j: j['created_at'], reverse=True)
+        return jsonify([_public(j) for j in jobs])
+
+@jobs_bp.route('/admin/jobs/<job_id>', methods=['GET'])
+def admin_get_job(job_id):
+    job = _jobs.get(job_id)
+    if not job: return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_public(job))
+
+@jobs_bp.route('/admin/jobs/<job_id>/cancel', methods=['POST'])
+def admin_cancel_job(job_id):
+    # Onder _lock: submit publiceert de job en zet _future binnen dezelfde lock
+    with _lock:
+        job = _jobs.get(job_id)
+        if not job: return jsonify({'error': 'Job not found'}), 404
+        job['_cancel'].set()
+        if job['status'] == 'queued' and job['_future'].cancel():
+            job['status'] = 'cancelled'
+            job['finished_at'] = datetime.datetime.utcnow().isoformat()
+        return jsonify(_public(job))
+
+@jobs_bp.route('/admin/jobs/<job_id>/download', methods=['GET'])
+def admin_download_job(job_id):
+    """(ADMIN) Download het resultaat van een afgeronde export job."""
+    job = _jobs.get(job_id)
+    if not job or job['type'] != 'export' or job['status'] != 'done':
+        return jsonify({'error': 'Export not available'}), 404
+    name = job['params']['collection']
+    return send_from_directory(EXPORT_FOLDER, os.path.basename(job['_export_path']),
+                               as_attachment=True, download_name=f"{name}.json", mimetype="application/json")
@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import random
+import datetime
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from flask import Blueprint, request, jsonify, g, Response, has_request_context
+from pymongo.errors import CollectionInvalid
+from admission import unsampled
+
+# Blueprint voor de admin profiling routes
+profiler_bp = Blueprint('profiler', __name__)
+
+# Configuratie (alles staat standaard UIT)
+# G2_PROFILE_SAMPLE_RATE: fractie (0.0 - 1.0) van requests die automatisch geprofiled worden
+# G2_SLOW_MS: requests boven deze duur komen in _g2_slowlog (0 = uit)
+PROFILE_HEADER = 'x-g2-profile'
+SAMPLE_RATE = float(os.environ.get('G2_PROFILE_SAMPLE_RATE', '0'))
+SLOW_MS = float(os.environ.get('G2_SLOW_MS', '0'))
+SLOWLOG_COLLECTION = '_g2_slowlog'
+SLOWLOG_SIZE_BYTES = int(os.environ.get('G2_SLOWLOG_SIZE_BYTES', str(8 * 1024 * 1024)))
+SLOWLOG_MAX_DOCS = int(os.environ.get('G2_SLOWLOG_MAX_DOCS', '5000'))
+
+_slowlog_ready = False
+_get_db = None
+
+def _active():
+    return has_request_context() and g.get('_g2_spans') is not None
+
+@contextmanager
+def span(name):
+    """Meet de duur van een stap binnen het huidige request (no-op als profiling uit staat)."""
+    if not _active():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        spans = g._g2_spans
+        spans[name] = spans.get(name, 0.0) + elapsed
+
+def timed(name):
+    """DECORATOR: Zelfde als span(), maar dan voor een hele functie."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not _active():
+                return f(*args, **kwargs)
+            with span(name):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def note_query(collection_name, query):
+    """Onthoud de query van dit request zodat een slow request een explain kan krijgen."""
+    if _active():
+        g._g2_query = (collection_name, query)
+
+# --- REQUEST HOOKS ---
+
+def _start_request():
+    explicit = request.headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes')
+    sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+    g._g2_emit_timing = explicit or sampled
+    # Spans worden ook verzameld als de slowlog aan staat, anders heeft een slow entry geen breakdown
+    if g._g2_emit_timing or SLOW_MS > 0:
+        g._g2_spans = {}
+        g._g2_start = time.perf_counter()
+
+def _finish_request(response):
+    spans = g.get('_g2_spans')
+    if spans is None:
+        return response
+    total = (time.perf_counter() - g._g2_start) * 1000
+    if g.get('_g2_emit_timing'):
+        parts = [f"{name};dur={dur:.2f}" for name, dur in spans.items()]
+        parts.append(f"total;dur={total:.2f}")
+        response.headers['Server-Timing'] = ', '.join(parts)
+    if SLOW_MS > 0 and total >= SLOW_MS:
+        _record_slow(response, spans, total)
+    return response
+
+def init_app(app, get_db):
+    global _get_db
+    _get_db = get_db
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+# --- SLOWLOG ---
+
+def _ensure_slowlog(db):
+    global _slowlog_ready
+    if _slowlog_ready:
+        return
+    try:
+        db.create_collection(SLOWLOG_COLLECTION, capped=True, size=SLOWLOG_SIZE_BYTES, max=SLOWLOG_MAX_DOCS)
+    except CollectionInvalid:
+        pass
+    _slowlog_ready = True
+
+def _explain_summary(db, collection_name, query):
+    """
+    Vat het query plan samen. Bewust met 'queryPlanner' verbosity: dat kiest alleen een plan
+    en voert de (al trage) query niet nog een keer uit, zoals cursor.explain() wel doet.
+    """
+    try:
+        plan = db.command({'explain': {'find': collection_name, 'filter': query}, 'verbosity': 'queryPlanner'})
+        planner = plan.get('queryPlanner', {})
+        winning = planner.get('winningPlan', {})
+        stages, indexes = [], []
+        while winning:
+            stages.append(winning.get('stage'))
+            if winning.get('indexName'): indexes.append(winning['indexName'])
+            winning = winning.get('inputStage')
+        return {
+            'stages': stages,
+            'indexes': indexes,
+            'collection_scan': 'COLLSCAN' in stages,
+            'rejected_plans': len(planner.get('rejectedPlans', []))
+        }
+    except Exception as e:
+        return {'error': str(e)}
+
+def _record_slow(response, spans, total):
+    """
+    Legt de request gegevens nu vast, maar schrijft pas nadat het antwoord verstuurd is:
+    create_collection, explain en insert mogen een al trage request niet nog trager maken.
+    """
+    entry = {
+        'timestamp': datetime.datetime.utcnow(),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': (request.view_args or {}).get('collection_name'),
+        'client_id': g.get('client_id'),
+        'status': response.status_code,
+        'total_ms': round(total, 2),
+        'spans': {k: round(v, 2) for k, v in spans.items()}
+    }
+    query = g.get('_g2_query')
+    response.call_on_close(lambda: _write_slow(entry, query))
+
+def _write_slow(entry, query):
+    # De slowlog zelf (get_db, explain, insert) telt niet mee voor load shedding
+    with unsampled():
+        try:
+            db = _get_db()
+            if db is None:
+                return
+            _ensure_slowlog(db)
+            if query:
+                entry['explain'] = _explain_summary(db, *query)
+            db[SLOWLOG_COLLECTION].insert_one(entry)
+        except:
+            pass
+
+@profiler_bp.route('/admin/slowlog', methods=['GET'])
+def admin_slowlog():
+    """(ADMIN) De laatste trage requests, nieuwste eerst."""
+    db = _get_db()
+    if db is None: return jsonify({'error': 'DB Offline'}), 500
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({'error': 'Invalid limit'}), 400
+    query = {}
+    if request.args.get('endpoint'):
+        query['endpoint'] = request.args.get('endpoint')
+    entries = list(db[SLOWLOG_COLLECTION].find(query).sort('$natural', -1).limit(limit))
+    for e in entries:
+        e['_id'] = str(e['_id'])
+        e['timestamp'] = e['timestamp'].isoformat()
+    return jsonify(entries)
+
+@profiler_bp.route('/admin/slowlog/clear', methods=['POST'])
+def admin_slowlog_clear():
+    """(ADMIN) Gooit de slowlog weg; capped collections kunnen niet via delete_many geleegd worden."""
+    global _slowlog_ready
+    db = _get_db()
+    if db is None: return jsonify({'error': 'DB Offline'}), 500
+    db[SLOWLOG_COLLECTION].drop()
+    _slowlog_ready = False
+    return jsonify({"status": "cleared"})
+
+# --- SAMPLING PROFILER ---
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def sample_stacks(seconds, interval):
+    """
+    Sampled periodiek de stacks van alle andere threads en telt identieke stacks.
+    Output is het 'collapsed' formaat van flamegraph.pl / speedscope:
+        root;caller;callee <aantal>
+    """
+    own = threading.get_ident()
+    counts = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for tid, frame in sys._current_frames().items():
+            if tid == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+    return '\n'.join(f"{k} {v}" for k, v in sorted(counts.items())) + '\n'
+
+@profiler_bp.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """
+    (ADMIN) Draait de sampling profiler een aantal seconden en levert flamegraph input.
+    URL: POST /api/admin/profile?seconds=10&interval_ms=10
+    """
+    seconds = min(max(float(request.args.get('seconds', 10)), 0.1), 60)
+    interval = max(float(request.args.get('interval_ms', 10)), 1) / 1000
+    output = sample_stacks(seconds, interval)
+    return Response(output, mimetype="text/plain", headers={"Content-Disposition": "attachment;filename=profile.folded"})
@@ -0,0 +1,376 @@
+import os
+import gzip
+import datetime
+import threading
+from flask import Blueprint, request, jsonify
+from bson import encode, decode_file_iter, ObjectId
+from pymongo import InsertOne, ReplaceOne, DeleteOne
+from werkzeug.utils import secure_filename
+import jobs
+
+# Blueprint voor de admin snapshot routes
+snapshots_bp = Blueprint('snapshots', __name__)
+
+# Snapshots staan op schijf als gzip gecomprimeerde BSON streams:
+#   snapshots/<endpoint>/<id>.bson.gz   documenten (base) of operaties (delta)
+#   snapshots/<endpoint>/<id>.ids.gz    alle _id's op dat moment, gesorteerd zoals Mongo ze sorteert
+# De index (welke snapshots er zijn, keten, tijdstippen) staat in _g2_snapshots, samen met een
+# 'restore' marker per restore: de snapshot daarna moet een volledige base zijn.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_FOLDER = os.path.join(BASE_DIR, 'snapshots')
+SNAPSHOT_COLLECTION = '_g2_snapshots'
+SNAPSHOT_KINDS = ['base', 'delta']
+BATCH_SIZE = int(os.environ.get('G2_SNAPSHOT_BATCH_SIZE', '1000'))
+
+_get_db = None
+_END = object()
+_endpoint_locks = {}
+_endpoint_locks_lock = threading.Lock()
+
+def init_app(app, get_db):
+    global _get_db
+    _get_db = get_db
+
+def _endpoint_lock(endpoint):
+    """
+    Snapshot en restore jobs voor hetzelfde endpoint lopen na elkaar. Twee gelijktijdige
+    snapshots zouden anders dezelfde parent kiezen en de keten laten splitsen.
+    """
+    with _endpoint_locks_lock:
+        return _endpoint_locks.setdefault(endpoint, threading.Lock())
+
+# --- BESTANDEN ---
+
+def _paths(endpoint, snapshot_id):
+    folder = os.path.join(SNAPSHOT_FOLDER, secure_filename(endpoint))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return os.path.join(folder, f"{snapshot_id}.bson.gz"), os.path.join(folder, f"{snapshot_id}.ids.gz")
+
+def _read(path):
+    with gzip.open(path, 'rb') as f:
+        for doc in decode_file_iter(f):
+            yield doc
+
+def _id_key(v):
+    """Sorteersleutel die overeenkomt met de BSON volgorde van Mongo voor de gangbare _id types."""
+    if isinstance(v, bool): return (8, v)
+    if isinstance(v, (int, float)): return (1, v)
+    if isinstance(v, str): return (2, v.encode())
+    if isinstance(v, ObjectId): return (7, v.binary)
+    if isinstance(v, datetime.datetime): return (9, v)
+    return (99, str(v))
+
+def _diff_ids(prev_ids, cur_ids):
+    """Merge-walk over twee gesorteerde id streams; geeft ('deleted', id) en ('added', id) terug."""
+    prev, cur = next(prev_ids, _END), next(cur_ids, _END)
+    while prev is not _END or cur is not _END:
+        if cur is _END or (prev is not _END and _id_key(prev) < _id_key(cur)):
+            yield 'deleted', prev
+            prev = next(prev_ids, _END)
+        elif prev is _END or _id_key(cur) < _id_key(prev):
+            yield 'added', cur
+            cur = next(cur_ids, _END)
+        else:
+            prev, cur = next(prev_ids, _END), next(cur_ids, _END)
+
+# --- SNAPSHOT MAKEN ---
+
+def job_snapshot(db, ctx, endpoint, full=False):
+    """Maakt een base snapshot, of een delta t.o.v. de vorige snapshot als er al een base is."""
+    with _endpoint_lock(endpoint):
+        return _snapshot(db, ctx, endpoint, full)
+
+def _snapshot(db, ctx, endpoint, full):
+    index = db[SNAPSHOT_COLLECTION]
+    col = db[endpoint]
+    latest = None if full else index.find_one({'endpoint': endpoint}, sort=[('created_at', -1)])
+    # Na een restore staat er oude inhoud met oude tijdstempels en dezelfde _id's in de collectie;
+    # een delta zou die terugdraaiing niet zien, dus dan altijd een nieuwe base
+    parent = latest if latest and latest['kind'] != 'restore' else None
+    now = datetime.datetime.utcnow()
+    snapshot_id = f"{secure_filename(endpoint)}_{now.strftime('%Y%m%dT%H%M%S%f')}"
+    data_path, ids_path = _paths(endpoint, snapshot_id)
+    ctx.set_total(col.estimated_document_count())
+    entry = {
+        '_id': snapshot_id,
+        'endpoint': endpoint,
+        'created_at': now,
+        'file': os.path.basename(data_path),
+        'ids_file': os.path.basename(ids_path)
+    }
+    try:
+        if parent is None:
+            entry.update(_write_base(col, ctx, data_path, ids_path), kind='base', base_id=snapshot_id, parent_id=None)
+        else:
+            prev_ids_path = os.path.join(os.path.dirname(ids_path), parent['ids_file'])
+            entry.update(_write_delta(col, ctx, data_path, ids_path, prev_ids_path, parent['created_at']),
+                         kind='delta', base_id=parent['base_id'], parent_id=parent['_id'], since=parent['created_at'])
+    except BaseException:
+        for path in (data_path, ids_path):
+            if os.path.exists(path): os.remove(path)
+        raise
+    entry['size_bytes'] = os.path.getsize(data_path) + os.path.getsize(ids_path)
+    index.insert_one(entry)
+    return {'snapshot_id': snapshot_id, 'kind': entry['kind'], 'count': entry['count'], 'deleted': entry['deleted']}
+
+def _write_base(col, ctx, data_path, ids_path):
+    count = 0
+    with gzip.open(data_path, 'wb') as data, gzip.open(ids_path, 'wb') as ids:
+        # Gesorteerd op _id, zodat het id bestand meteen in de goede volgorde staat
+        for doc in col.find({}, batch_size=BATCH_SIZE).sort('_id', 1):
+            data.write(encode(doc))
+            ids.write(encode({'_id': doc['_id']}))
+            count += 1
+            if count % BATCH_SIZE == 0:
+                ctx.advance(BATCH_SIZE)
+    return {'count': count, 'deleted': 0}
+
+def _write_delta(col, ctx, data_path, ids_path, prev_ids_path, since):
+    """
+    Een delta bevat upserts voor alles wat sinds 'since' is aangemaakt of gewijzigd
+    (via _meta.created_at / _meta.updated_at) en tombstones voor verwijderde documenten.
+    Verwijderingen en documenten zonder _meta tijdstempels worden gevonden door de
+    gesorteerde id lijst van de vorige snapshot te vergelijken met de huidige.
+    """
+    count, deleted = 0, 0
+    changed = {'$or': [{'_meta.updated_at': {'$gte': since}}, {'_meta.created_at': {'$gte': since}}]}
+    with gzip.open(data_path, 'wb') as data, gzip.open(ids_path, 'wb') as ids:
+        for doc in col.find(changed, batch_size=BATCH_SIZE):
+            data.write(encode({'op': 'u', 'doc': doc}))
+            count += 1
+            if count % BATCH_SIZE == 0:
+                ctx.advance(BATCH_SIZE)
+
+        def current_ids():
+            for d in col.find({}, {'_id': 1}, batch_size=BATCH_SIZE).sort('_id', 1):
+                ids.write(encode(d))
+                yield d['_id']
+
+        prev_ids = (d['_id'] for d in _read(prev_ids_path))
+        added = []
+        for change, doc_id in _diff_ids(prev_ids, current_ids()):
+            if change == 'deleted':
+                data.write(encode({'op': 'd', '_id': doc_id}))
+                deleted += 1
+            else:
+                added.append(doc_id)
+                if len(added) == BATCH_SIZE:
+                    count += _write_added(col, data, added)
+                    added = []
+        if added:
+            count += _write_added(col, data, added)
+    return {'count': count, 'deleted': deleted}
+
+def _write_added(col, data, ids):
+    # Kan een document opleveren dat ook al via de tijdstempels mee kwam; upsert is idempotent
+    n = 0
+    for doc in col.find({'_id': {'$in': ids}}):
+        data.write(encode({'op': 'u', 'doc': doc}))
+        n += 1
+    return n
+
+# --- RESTORE ---
+
+def _restore_chain(index, endpoint, snapshot_id=None, at=None):
+    """
+    Bepaalt de base + deltas die nodig zijn om het endpoint naar het gekozen punt terug te zetten.
+    De keten wordt via parent_id teruggelopen, zodat deltas uit een zijtak nooit mee komen.
+    """
+    if snapshot_id:
+        target = index.find_one({'_id': snapshot_id, 'endpoint': endpoint, 'kind': {'$in': SNAPSHOT_KINDS}})
+    else:
+        point = _parse_at(at) if at else datetime.datetime.utcnow()
+        target = index.find_one({'endpoint': endpoint, 'kind': {'$in': SNAPSHOT_KINDS}, 'created_at': {'$lte': point}},
+                                sort=[('created_at', -1)])
+    if not target:
+        raise ValueError('Geen snapshot gevonden voor dit punt')
+    chain = [target]
+    while chain[-1]['kind'] != 'base':
+        parent = index.find_one({'_id': chain[-1]['parent_id']})
+        if not parent:
+            raise ValueError(f"Snapshot keten is onvolledig: {chain[-1]['parent_id']} ontbreekt")
+        chain.append(parent)
+    chain.reverse()
+    return target, chain
+
+def _parse_at(at):
+    """ISO tijdstip naar naive UTC, zoals created_at in de index; ook met 'Z' suffix (Python < 3.11)."""
+    if at.endswith(('Z', 'z')):
+        at = at[:-1] + '+00:00'
+    point = datetime.datetime.fromisoformat(at)
+    if point.tzinfo is not None:
+        point = point.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return point
+
+def _replay(folder, chain, owner=None):
+    """
+    Zet de snapshot bestanden van een keten om in ('insert' | 'upsert' | 'delete', payload)
+    operaties, in de volgorde waarin ze toegepast moeten worden.
+    """
+    def matches(doc):
+        return owner is None or (doc.get('_meta') or {}).get('owner') == owner
+
+    for snap in chain:
+        for rec in _read(os.path.join(folder, snap['file'])):
+            if snap['kind'] == 'base':
+                if matches(rec): yield 'insert', rec
+            elif rec['op'] == 'd':
+                yield 'delete', rec['_id']
+            elif matches(rec['doc']):
+                yield 'upsert', rec['doc']
+            else:
+                # Document is sindsdien van een andere owner geworden
+                yield 'delete', rec['doc']['_id']
+
+def _to_op(kind, payload):
+    if kind == 'insert': return InsertOne(payload)
+    if kind == 'upsert': return ReplaceOne({'_id': payload['_id']}, payload, upsert=True)
+    return DeleteOne({'_id': payload})
+
+def _flush(col, ops, ordered=True):
+    if ops:
+        col.bulk_write(ops, ordered=ordered)
+    return []
+
+def job_restore(db, ctx, endpoint, snapshot_id=None, at=None, owner=None, target=None):
+    """
+    Zet een endpoint (of alleen de records van één owner) terug naar een snapshot.
+    Alles wordt gestreamd naar een staging collectie, zodat geheugengebruik per batch begrensd blijft.
+    Een volledige restore wisselt daarna atomair om via renameCollection.
+    """
+    with _endpoint_lock(endpoint):
+        return _restore(db, ctx, endpoint, snapshot_id, at, owner, target)
+
+def _restore(db, ctx, endpoint, snapshot_id, at, owner, target):
+    index = db[SNAPSHOT_COLLECTION]
+    point, chain = _restore_chain(index, endpoint, snapshot_id, at)
+    ctx.set_total(sum(s['count'] + s['deleted'] for s in chain))
+    folder = os.path.join(SNAPSHOT_FOLDER, secure_filename(endpoint))
+    target = target or endpoint
+    staging = db[f"_g2_restore_{ctx.job['id']}"]
+    staging.drop()
+
+    try:
+        ops = []
+        for kind, payload in _replay(folder, chain, owner):
+            ops.append(_to_op(kind, payload))
+            if len(ops) == BATCH_SIZE:
+                ops = _flush(staging, ops)
+                ctx.advance(BATCH_SIZE)
+        _flush(staging, ops)
+
+        restored = staging.count_documents({})
+        # Marker vóór het omzetten: ook een half gelukte owner restore moet de volgende snapshot een base maken
+        index.insert_one({
+            '_id': f"restore_{ctx.job['id']}",
+            'endpoint': target,
+            'kind': 'restore',
+            'created_at': datetime.datetime.utcnow(),
+            'snapshot_id': point['_id'],
+            'owner': owner
+        })
+        if owner is None:
+            # Indexen van het huidige doel overnemen, daarna atomair omwisselen
+            for name, info in db[target].index_information().items():
+                if name == '_id_': continue
+                opts = {k: v for k, v in info.items() if k not in ('key', 'v', 'ns')}
+                staging.create_index(info['key'], name=name, **opts)
+            staging.rename(target, dropTarget=True)
+        else:
+            _apply_owner_restore(db[target], staging, owner)
+    except jobs.JobCancelled:
+        raise
+    except Exception as e:
+        # Staging blijft bewaard: bij een owner restore kan het doel al deels bijgewerkt zijn
+        raise RuntimeError(f"{e} (staging collectie {staging.name} is bewaard)") from e
+    staging.drop()
+    return {'snapshot_id': point['_id'], 'restored': restored, 'target': target, 'owner': owner}
+
+def _apply_owner_restore(live, staging, owner):
+    """
+    Eerst upserten, dan pas opruimen: er wordt nooit iets verwijderd voordat de
+    snapshot versie van de owner er volledig in staat.
+    """
+    ops = []
+    for doc in staging.find({}, batch_size=BATCH_SIZE):
+        ops.append(ReplaceOne({'_id': doc['_id']}, doc, upsert=True))
+        if len(ops) == BATCH_SIZE:
+            ops = _flush(live, ops, ordered=False)
+    _flush(live, ops, ordered=False)
+
+    # Records van de owner die niet in de snapshot voorkwamen verwijderen
+    ids = []
+    for d in live.find({'_meta.owner': owner}, {'_id': 1}, batch_size=BATCH_SIZE):
+        ids.append(d['_id'])
+        if len(ids) == BATCH_SIZE:
+            _delete_missing(live, staging, ids)
+            ids = []
+    if ids:
+        _delete_missing(live, staging, ids)
+
+def _delete_missing(live, staging, ids):
+    keep = {d['_id'] for d in staging.find({'_id': {'$in': ids}}, {'_id': 1})}
+    gone = [i for i in ids if i not in keep]
+    if gone:
+        live.delete_many({'_id': {'$in': gone}})
+
+jobs.register('snapshot', job_snapshot, ['endpoint'], ['full'])
+jobs.register('restore', job_restore, ['endpoint'], ['snapshot_id', 'at', 'owner', 'target'])
+
+# --- ADMIN ROUTES ---
+
+@snapshots_bp.route('/admin/snapshots', methods=['GET'])
+def admin_list_snapshots():
+    """(ADMIN) Lijst van snapshots, optioneel gefilterd op ?endpoint=, nieuwste eerst."""
+    db = _get_db()
+    if db is None: return jsonify({'error': 'DB Offline'}), 500
+    query = {'kind': {'$in': SNAPSHOT_KINDS}}
+    if request.args.get('endpoint'):
+        query['endpoint'] = request.args.get('endpoint')
+    snaps = list(db[SNAPSHOT_COLLECTION].find(query).sort('created_at', -1))
+    for s in snaps:
+        s['created_at'] = s['created_at'].isoformat()
+        if s.get('since'): s['since'] = s['since'].isoformat()
+    return jsonify(snaps)
+
+@snapshots_bp.route('/admin/snapshots', methods=['POST'])
+def admin_create_snapshot():
+    """
+    (ADMIN) Start een snapshot job.
+    Body: {"endpoint": "...", "full": false}  -> delta als er al een base is, anders base
+    """
+    data = request.json or {}
+    if not data.get('endpoint'): return jsonify({'error': 'Geen endpoint opgegeven'}), 400
+    return jobs.submit_response('snapshot', endpoint=data['endpoint'], full=bool(data.get('full', False)))
+
+@snapshots_bp.route('/admin/snapshots/restore', methods=['POST'])
+def admin_restore_snapshot():
+    """
+    (ADMIN) Start een restore job.
+    Body: {"endpoint": "...", "snapshot_id" | "at": ISO tijdstip, "owner": optioneel, "target": optioneel}
+    """
+    data = request.json or {}
+    if not data.get('endpoint'): return jsonify({'error': 'Geen endpoint opgegeven'}), 400
+    params = {k: data[k] for k in ('snapshot_id', 'at', 'owner', 'target') if data.get(k)}
+    if 'at' in params:
+        try: _parse_at(params['at'])
+        except (TypeError, ValueError, AttributeError): return jsonify({'error': 'Ongeldig tijdstip voor at'}), 400
+    return jobs.submit_response('restore', endpoint=data['endpoint'], **params)
+
+@snapshots_bp.route('/admin/snapshots/<snapshot_id>', methods=['DELETE'])
+def admin_delete_snapshot(snapshot_id):
+    """(ADMIN) Verwijdert een snapshot plus alle latere snapshots in dezelfde keten (die bouwen erop voort)."""
+    db = _get_db()
+    if db is None: return jsonify({'error': 'DB Offline'}), 500
+    index = db[SNAPSHOT_COLLECTION]
+    snap = index.find_one({'_id': snapshot_id})
+    if not snap: return jsonify({'error': 'Snapshot not found'}), 404
+    folder = os.path.join(SNAPSHOT_FOLDER, secure_filename(snap['endpoint']))
+    doomed = list(index.find({'base_id': snap['base_id'], 'created_at': {'$gte': snap['created_at']}}))
+    for s in doomed:
+        for name in (s['file'], s['ids_file']):
+            path = os.path.join(folder, name)
+            if os.path.exists(path): os.remove(path)
+    index.delete_many({'_id': {'$in': [s['_id'] for s in doomed]}})
+    return jsonify({'deleted': [s['_id'] for s in doomed]})
@@ -0,0 +1,172 @@
+import os
+import sys
+import copy
+from types import SimpleNamespace
+import pytest
+from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne, DeleteOne
+
+# Tests draaien zonder mongod: admission uit en een onbereikbare Mongo, de routes krijgen een FakeDB
+os.environ.setdefault('G2_ADMISSION_ENABLED', '0')
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1/')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_MISSING = object()
+
+def _get(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+def _set(doc, path, value):
+    *parents, last = path.split('.')
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+def _matches(doc, query):
+    for path, cond in (query or {}).items():
+        if path == '$or':
+            if not any(_matches(doc, q) for q in cond): return False
+            continue
+        value = _get(doc, path)
+        if isinstance(cond, dict) and cond and all(k.startswith('$') for k in cond):
+            for op, arg in cond.items():
+                if op == '$in':
+                    if (None if value is _MISSING else value) not in arg: return False
+                elif op == '$lte':
+                    if value is _MISSING or not value <= arg: return False
+                elif op == '$gte':
+                    if value is _MISSING or not value >= arg: return False
+                elif op == '$ne':
+                    if value == arg: return False
+                else:
+                    raise NotImplementedError(op)
+        elif value is _MISSING or value != cond:
+            return False
+    return True
+
+class FakeCursor(list):
+    def sort(self, key, direction=1):
+        return FakeCursor(sorted(self, key=lambda d: _get(d, key), reverse=direction < 0))
+
+    def limit(self, n):
+        return FakeCursor(self[:n] if n else self)
+
+class FakeCollection:
+    """Minimale in-memory collectie met alleen wat de gateway modules gebruiken."""
+
+    def __init__(self, name, db=None):
+        self.name = name
+        self.db = db
+        self.docs = {}
+
+    def _find(self, query):
+        return [d for d in self.docs.values() if _matches(d, query)]
+
+    def find(self, query=None, projection=None, sort=None, **kwargs):
+        docs = self._find(query)
+        if projection:
+            docs = [{k: d[k] for k in ['_id', *projection] if k in d} for d in docs]
+        return FakeCursor(copy.deepcopy(d) for d in docs)
+
+    def find_one(self, query=None, projection=None, sort=None, **kwargs):
+        docs = self._find(query)
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: _get(d, key), reverse=direction < 0)
+        return copy.deepcopy(docs[0]) if docs else None
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def index_information(self):
+        return {'_id_': {'key': [('_id', 1)]}}
+
+    def rename(self, new_name, dropTarget=False):
+        # Zoals in Mongo: het object blijft naar de oude (nu lege) naam wijzen
+        moved = FakeCollection(new_name, self.db)
+        moved.docs, self.docs = self.docs, {}
+        self.db.collections[new_name] = moved
+        self.db.collections.pop(self.name, None)
+
+    def count_documents(self, query, limit=None):
+        n = len(self._find(query))
+        return min(n, limit) if limit else n
+
+    def insert_one(self, doc):
+        doc.setdefault('_id', ObjectId())
+        if doc['_id'] in self.docs:
+            raise ValueError('duplicate key')
+        self.docs[doc['_id']] = copy.deepcopy(doc)
+        return SimpleNamespace(inserted_id=doc['_id'])
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.insert_one(doc)
+
+    def replace_one(self, query, doc, upsert=False):
+        found = self._find(query)
+        if found:
+            _id = found[0]['_id']
+            self.docs[_id] = dict(copy.deepcopy(doc), _id=_id)
+        elif upsert:
+            _id = doc.get('_id', query.get('_id'))
+            self.docs[_id] = dict(copy.deepcopy(doc), _id=_id)
+        return SimpleNamespace(matched_count=len(found[:1]))
+
+    def find_one_and_update(self, query, update, return_document=False, **kwargs):
+        found = self._find(query)
+        if not found:
+            return None
+        doc = found[0]
+        for path, value in update.get('$set', {}).items():
+            _set(doc, path, copy.deepcopy(value))
+        for path, n in update.get('$inc', {}).items():
+            current = _get(doc, path)
+            _set(doc, path, (0 if current in (_MISSING, None) else current) + n)
+        return copy.deepcopy(doc)
+
+    def update_one(self, query, update, upsert=False):
+        if not self._find(query) and upsert:
+            self.docs[query['_id']] = {'_id': query['_id']}
+        return self.find_one_and_update(query, update)
+
+    def delete_one(self, query):
+        found = self._find(query)[:1]
+        for doc in found:
+            del self.docs[doc['_id']]
+        return SimpleNamespace(deleted_count=len(found))
+
+    def delete_many(self, query):
+        found = self._find(query)
+        for doc in found:
+            del self.docs[doc['_id']]
+        return SimpleNamespace(deleted_count=len(found))
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            if isinstance(op, InsertOne): self.insert_one(op._doc)
+            elif isinstance(op, ReplaceOne): self.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, DeleteOne): self.delete_one(op._filter)
+            else: raise NotImplementedError(op)
+
+    def drop(self):
+        self.docs.clear()
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self)
+        return self.collections[name]
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
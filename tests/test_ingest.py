@@ -0,0 +1,195 @@
+import datetime
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure, InvalidName
+import ingest
+
+@pytest.fixture(autouse=True)
+def clean_buffer(monkeypatch):
+    # Geen achtergrond flusher in tests; flush() wordt expliciet aangeroepen
+    monkeypatch.setattr(ingest, '_ensure_flusher', lambda: None)
+    monkeypatch.setattr(ingest, '_log_activity', lambda *args, **kwargs: None)
+    monkeypatch.setattr(ingest, '_pending', 0)
+    monkeypatch.setattr(ingest, '_retries', {})
+    monkeypatch.setattr(ingest, '_stats', dict.fromkeys(ingest._stats, 0))
+    monkeypatch.setattr(ingest, 'cached_config', lambda col_name: {})
+    ingest._buffer.clear()
+    yield
+    ingest._buffer.clear()
+
+def _events(n, owner='alice'):
+    return [{'_id': ObjectId(), '_meta': {'owner': owner}, 'n': i} for i in range(n)]
+
+class FlakyDB:
+    """insert_many gooit eerst `failures` keer de gegeven exception (optioneel alleen voor één collectie)."""
+
+    def __init__(self, error, failures=1, only=None):
+        self.error, self.failures, self.only = error, failures, only
+        self.written = {}
+
+    def get_collection(self, name, **kwargs):
+        self.name = name
+        return self
+
+    def insert_many(self, docs, ordered=True):
+        if self.failures and self.only in (None, self.name):
+            self.failures -= 1
+            raise self.error
+        self.written.setdefault(self.name, []).extend(docs)
+
+def test_enqueue_rejects_when_buffer_full(monkeypatch):
+    monkeypatch.setattr(ingest, 'BUFFER_SIZE', 5)
+    assert ingest.enqueue('events', 1, _events(3))
+    assert not ingest.enqueue('events', 1, _events(3))
+    assert ingest.stats()['buffered'] == 3
+    assert ingest._stats['rejected'] == 3
+
+def test_enqueue_counts_batches_being_flushed(monkeypatch):
+    monkeypatch.setattr(ingest, 'BUFFER_SIZE', 5)
+    monkeypatch.setattr(ingest, '_pending', 4)
+    assert not ingest.enqueue('events', 1, _events(2))
+
+def _due_now():
+    for r in ingest._retries.values():
+        r['at'] = 0
+
+def test_transient_error_retries_group_without_blocking_others(monkeypatch):
+    db = FlakyDB(AutoReconnect('failover'), only='events')
+    monkeypatch.setattr(ingest, '_db', lambda: db)
+    events, other = _events(3), _events(1)
+    ingest.enqueue('events', 1, events)
+    ingest.enqueue('other', 1, other)
+
+    assert ingest.flush() is False
+    assert db.written == {'other': other}
+    assert ingest._stats['failed'] == 0
+    assert ingest._stats['retried'] == 3
+    # Events in retry blijven meetellen voor de buffergrens
+    assert ingest.stats()['buffered'] == 3
+
+    # Nieuwe events voor een endpoint in backoff sluiten achteraan aan
+    later = _events(1)
+    ingest.enqueue('events', 1, later)
+    assert ingest.flush() is False
+    assert 'events' not in db.written
+
+    _due_now()
+    assert ingest.flush() is True
+    assert db.written['events'] == events + later
+    assert ingest._stats['flushed'] == 5
+    assert ingest.stats()['buffered'] == 0
+
+@pytest.mark.parametrize('error', [
+    OperationFailure('time series not supported', code=72),
+    InvalidName('bad collection name'),
+])
+def test_permanent_error_drops_group(monkeypatch, error):
+    db = FlakyDB(error, only='events')
+    monkeypatch.setattr(ingest, '_db', lambda: db)
+    ingest.enqueue('events', 1, _events(2))
+    ingest.enqueue('other', 1, _events(1))
+
+    assert ingest.flush() is True
+    assert ingest._stats['failed'] == 2
+    assert ingest._stats['flushed'] == 1
+    assert ingest.stats()['buffered'] == 0
+
+def test_retryable_write_error_label_is_retried(monkeypatch):
+    error = OperationFailure('not primary', code=10107)
+    error._add_error_label('RetryableWriteError')
+    monkeypatch.setattr(ingest, '_db', lambda: FlakyDB(error))
+    ingest.enqueue('events', 1, _events(1))
+    assert ingest.flush() is False
+
+def test_bulk_write_error_drops_only_rejected_documents(monkeypatch):
+    error = BulkWriteError({'writeErrors': [
+        {'index': 0, 'code': 121, 'errmsg': 'Document failed validation'},
+        {'index': 1, 'code': 11000, 'keyPattern': {'_id': 1}, 'errmsg': 'duplicate key'},
+    ], 'writeConcernErrors': []})
+    monkeypatch.setattr(ingest, '_db', lambda: FlakyDB(error))
+    ingest.enqueue('events', 1, _events(3))
+
+    assert ingest.flush() is True
+    assert ingest._stats['failed'] == 1
+    assert ingest._stats['flushed'] == 2
+
+def test_write_concern_error_retries_are_capped(monkeypatch):
+    def wc_error():
+        return BulkWriteError({'writeErrors': [{'index': 2, 'code': 121, 'errmsg': 'Document failed validation'}],
+                               'writeConcernErrors': [{'code': 64, 'errmsg': 'waiting for replication timed out'}]})
+    monkeypatch.setattr(ingest, 'WC_RETRIES', 2)
+    db = FlakyDB(wc_error(), failures=100)
+    monkeypatch.setattr(ingest, '_db', lambda: db)
+    events = _events(3)
+    ingest.enqueue('events', 'majority', events)
+
+    assert ingest.flush() is False
+    assert ingest._retries[('events', 'majority')]['docs'] == events[:2]
+    assert ingest._stats['failed'] == 1
+
+    # Bij een retry komen alleen de twee geschreven events terug, elke keer met dezelfde WC fout
+    db.error = BulkWriteError({'writeErrors': [], 'writeConcernErrors': [{'code': 64, 'errmsg': 'timeout'}]})
+    for _ in range(2):
+        _due_now()
+        ingest.flush()
+    assert not ingest._retries
+    assert ingest._stats['unconfirmed'] == 2
+    assert ingest._stats['flushed'] == 2
+    assert ingest.stats()['buffered'] == 0
+
+def test_force_flush_ignores_backoff(monkeypatch):
+    db = FlakyDB(AutoReconnect('down'))
+    monkeypatch.setattr(ingest, '_db', lambda: db)
+    ingest.enqueue('events', 1, _events(1))
+    assert ingest.flush() is False
+    assert ingest.flush(force=True) is True
+
+@pytest.mark.parametrize('value, expected', [
+    (0, 0), (2, 2), ('1', 1), ('majority', 'majority'), (-1, None), (True, None), ('all', None), (1.5, None),
+])
+def test_parse_write_concern(value, expected):
+    assert ingest.parse_write_concern(value) == expected
+
+def test_time_value_accepts_z_suffix():
+    received = datetime.datetime(2024, 6, 1)
+    assert ingest.time_value('2024-01-01T12:00:00Z', received) == datetime.datetime(2024, 1, 1, 12)
+    assert ingest.time_value('2024-01-01T14:00:00+02:00', received) == datetime.datetime(2024, 1, 1, 12)
+    assert ingest.time_value(None, received) == received
+    with pytest.raises(ValueError):
+        ingest.time_value('yesterday', received)
+
+# --- route ---
+
+@pytest.fixture
+def client(monkeypatch):
+    import app as gateway
+    config = {'ingest': True, 'timeseries': True, 'timeseries_field': 'ts'}
+    monkeypatch.setattr(ingest, 'cached_config', lambda col_name: config)
+    return gateway.app.test_client()
+
+def test_ingest_route_returns_503_when_buffer_full(client, monkeypatch):
+    monkeypatch.setattr(ingest, 'BUFFER_SIZE', 2)
+    headers = {'x-client-id': 'alice'}
+    assert client.post('/api/events', json=[{'v': 1}, {'v': 2}], headers=headers).status_code == 202
+    res = client.post('/api/events', json={'v': 3}, headers=headers)
+    assert res.status_code == 503
+    assert res.headers['Retry-After'] == '1'
+
+def test_timeseries_meta_only_holds_owner(client):
+    res = client.post('/api/events', json={'v': 1, 'ts': '2024-01-01T12:00:00Z'}, headers={'x-client-id': 'alice'})
+    assert res.status_code == 202
+    _, _, doc = ingest._buffer[0]
+    assert doc['_meta'] == {'owner': 'alice'}
+    assert doc['ts'].year == 2024
+
+def test_ingest_route_rejects_unparseable_timestamp(client):
+    res = client.post('/api/events', json={'ts': 'gisteren'}, headers={'x-client-id': 'alice'})
+    assert res.status_code == 400
+    assert not ingest._buffer
+
+@pytest.mark.parametrize('w, status', [('majority', 200), (2, 200), (-1, 400), ('fast', 400)])
+def test_admin_settings_validates_ingest_w(fake_db, monkeypatch, w, status):
+    import app as gateway
+    monkeypatch.setattr(gateway, 'get_db', lambda: fake_db)
+    res = gateway.app.test_client().post('/api/admin/settings', json={'collection': 'events', 'ingest_w': w})
+    assert res.status_code == status
@@ -0,0 +1,25 @@
+import pytest
+import profiler
+import app as gateway
+
+@pytest.fixture
+def db(fake_db, monkeypatch):
+    fake_db.create_collection = lambda *args, **kwargs: None
+    monkeypatch.setattr(gateway, 'get_db', lambda: fake_db)
+    monkeypatch.setattr(profiler, '_get_db', lambda: fake_db)
+    monkeypatch.setattr(profiler, '_slowlog_ready', True)
+    return fake_db
+
+@pytest.mark.parametrize('limit', ['abc', '0'])
+def test_slowlog_rejects_invalid_limit(db, limit):
+    res = gateway.app.test_client().get(f'/api/admin/slowlog?limit={limit}')
+    assert res.status_code == 400
+
+def test_slow_request_is_logged_after_response(db, monkeypatch):
+    monkeypatch.setattr(profiler, 'SLOW_MS', 0.000001)
+    res = gateway.app.test_client().get('/api/items/abc', headers={'x-client-id': 'alice'}, buffered=False)
+    # Het antwoord is er al, de slowlog entry nog niet
+    assert not db[profiler.SLOWLOG_COLLECTION].docs
+    res.close()
+    entries = list(db[profiler.SLOWLOG_COLLECTION].docs.values())
+    assert [e['path'] for e in entries] == ['/api/items/abc']
@@ -0,0 +1,157 @@
+import gzip
+import datetime
+import pytest
+from bson import encode, ObjectId
+import snapshots
+
+def _ts(minute):
+    return datetime.datetime(2024, 1, 1, 12, minute)
+
+def _write(path, records):
+    with gzip.open(path, 'wb') as f:
+        for rec in records:
+            f.write(encode(rec))
+
+def _doc(_id, owner, **fields):
+    return {'_id': _id, '_meta': {'owner': owner}, **fields}
+
+def _apply(ops, docs=None):
+    docs = dict(docs or {})
+    for kind, payload in ops:
+        if kind == 'delete':
+            docs.pop(payload, None)
+        else:
+            docs[payload['_id']] = payload
+    return docs
+
+# --- _diff_ids ---
+
+def test_diff_ids_reports_added_and_deleted():
+    diff = list(snapshots._diff_ids(iter([1, 2, 4, 'a']), iter([2, 3, 4, 'b'])))
+    assert diff == [('deleted', 1), ('added', 3), ('deleted', 'a'), ('added', 'b')]
+
+def test_diff_ids_follows_mongo_type_order():
+    oids = sorted([ObjectId() for _ in range(3)], key=lambda o: o.binary)
+    prev = [5, 'x', oids[0], oids[1]]
+    cur = [5, oids[0], oids[1], oids[2]]
+    assert list(snapshots._diff_ids(iter(prev), iter(cur))) == [('deleted', 'x'), ('added', oids[2])]
+
+def test_diff_ids_empty_sides():
+    assert list(snapshots._diff_ids(iter([]), iter([1]))) == [('added', 1)]
+    assert list(snapshots._diff_ids(iter([1]), iter([]))) == [('deleted', 1)]
+
+# --- keten ---
+
+def _index(fake_db, *snaps):
+    index = fake_db[snapshots.SNAPSHOT_COLLECTION]
+    for snap in snaps:
+        index.insert_one(dict(snap, endpoint='events', count=0, deleted=0))
+    return index
+
+def test_restore_chain_follows_parent_id(fake_db):
+    index = _index(fake_db,
+        {'_id': 'b', 'kind': 'base', 'parent_id': None, 'created_at': _ts(0)},
+        {'_id': 'd1', 'kind': 'delta', 'parent_id': 'b', 'created_at': _ts(1)},
+        # Zijtak: ook op de base gebaseerd, maar later gemaakt
+        {'_id': 'd2', 'kind': 'delta', 'parent_id': 'b', 'created_at': _ts(2)},
+        {'_id': 'd3', 'kind': 'delta', 'parent_id': 'd1', 'created_at': _ts(3)})
+    target, chain = snapshots._restore_chain(index, 'events', snapshot_id='d3')
+    assert target['_id'] == 'd3'
+    assert [s['_id'] for s in chain] == ['b', 'd1', 'd3']
+
+def test_restore_chain_missing_parent(fake_db):
+    index = _index(fake_db, {'_id': 'd1', 'kind': 'delta', 'parent_id': 'gone', 'created_at': _ts(1)})
+    with pytest.raises(ValueError):
+        snapshots._restore_chain(index, 'events', snapshot_id='d1')
+
+# --- replay ---
+
+@pytest.fixture
+def chain(tmp_path):
+    _write(tmp_path / 'b.bson.gz', [_doc(1, 'alice', v=1), _doc(2, 'bob', v=1), _doc(3, 'alice', v=1)])
+    _write(tmp_path / 'd1.bson.gz', [
+        {'op': 'u', 'doc': _doc(1, 'alice', v=2)},
+        {'op': 'd', '_id': 3},
+        {'op': 'u', 'doc': _doc(4, 'alice', v=1)},
+        # Van alice naar bob overgegaan
+        {'op': 'u', 'doc': _doc(2, 'alice', v=2)},
+    ])
+    _write(tmp_path / 'd2.bson.gz', [{'op': 'u', 'doc': _doc(2, 'bob', v=3)}])
+    return tmp_path, [
+        {'_id': 'b', 'kind': 'base', 'file': 'b.bson.gz'},
+        {'_id': 'd1', 'kind': 'delta', 'file': 'd1.bson.gz'},
+        {'_id': 'd2', 'kind': 'delta', 'file': 'd2.bson.gz'},
+    ]
+
+def test_replay_full(chain):
+    folder, snaps = chain
+    docs = _apply(snapshots._replay(str(folder), snaps))
+    assert {k: d['v'] for k, d in docs.items()} == {1: 2, 2: 3, 4: 1}
+
+def test_replay_owner_drops_documents_of_other_owners(chain):
+    folder, snaps = chain
+    docs = _apply(snapshots._replay(str(folder), snaps, owner='alice'))
+    assert sorted(docs) == [1, 4]
+
+def test_owner_restore_upserts_then_deletes_missing(fake_db):
+    live, staging = fake_db['events'], fake_db['_g2_restore_x']
+    live.insert_many([_doc(1, 'alice', v=9), _doc(5, 'alice', v=1), _doc(6, 'bob', v=1)])
+    staging.insert_many([_doc(1, 'alice', v=2), _doc(4, 'alice', v=1)])
+    snapshots._apply_owner_restore(live, staging, 'alice')
+    assert {k: d['v'] for k, d in live.docs.items()} == {1: 2, 4: 1, 6: 1}
+
+# --- snapshot -> restore -> snapshot -> restore ---
+
+class _Ctx:
+    def __init__(self, job_id):
+        self.job = {'id': job_id}
+
+    def set_total(self, total): pass
+    def advance(self, n): pass
+
+def _edit(col, _id, v):
+    col.docs[_id]['v'] = v
+    col.docs[_id]['_meta']['updated_at'] = datetime.datetime.utcnow()
+
+def _values(col):
+    return {k: d['v'] for k, d in col.docs.items()}
+
+def test_snapshot_after_restore_captures_restored_content(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, 'SNAPSHOT_FOLDER', str(tmp_path))
+    created = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    fake_db['events'].insert_many([
+        {'_id': 1, 'v': 1, '_meta': {'owner': 'alice', 'created_at': created}},
+        {'_id': 2, 'v': 1, '_meta': {'owner': 'bob', 'created_at': created}},
+    ])
+
+    base = snapshots.job_snapshot(fake_db, _Ctx('s1'), 'events')['snapshot_id']
+    _edit(fake_db['events'], 1, 2)
+    delta = snapshots.job_snapshot(fake_db, _Ctx('s2'), 'events')
+    assert delta['kind'] == 'delta' and delta['count'] == 1
+
+    snapshots.job_restore(fake_db, _Ctx('r1'), 'events', snapshot_id=base)
+    assert _values(fake_db['events']) == {1: 1, 2: 1}
+
+    # Dit punt bevat X weer op v1; een delta zou dat missen omdat tijdstempels en _id's niet veranderden
+    after = snapshots.job_snapshot(fake_db, _Ctx('s3'), 'events')
+    assert after['kind'] == 'base'
+    _edit(fake_db['events'], 1, 3)
+
+    snapshots.job_restore(fake_db, _Ctx('r2'), 'events', snapshot_id=after['snapshot_id'])
+    assert _values(fake_db['events']) == {1: 1, 2: 1}
+
+def test_owner_restore_also_forces_next_base(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, 'SNAPSHOT_FOLDER', str(tmp_path))
+    fake_db['events'].insert_one({'_id': 1, 'v': 1, '_meta': {'owner': 'alice'}})
+    base = snapshots.job_snapshot(fake_db, _Ctx('s1'), 'events')['snapshot_id']
+    _edit(fake_db['events'], 1, 2)
+    snapshots.job_restore(fake_db, _Ctx('r1'), 'events', snapshot_id=base, owner='alice')
+    assert _values(fake_db['events']) == {1: 1}
+    assert snapshots.job_snapshot(fake_db, _Ctx('s2'), 'events')['kind'] == 'base'
+
+def test_restore_chain_at_accepts_z_suffix(fake_db):
+    index = _index(fake_db,
+        {'_id': 'b', 'kind': 'base', 'parent_id': None, 'created_at': _ts(0)},
+        {'_id': 'd1', 'kind': 'delta', 'parent_id': 'b', 'created_at': _ts(5)})
+    target, _ = snapshots._restore_chain(index, 'events', at='2024-01-01T12:03:00Z')
+    assert target['_id'] == 'b'
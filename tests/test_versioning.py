@@ -0,0 +1,99 @@
+import pytest
+from bson import ObjectId
+import app as gateway
+
+ALICE = {'x-client-id': 'alice'}
+
+@pytest.fixture
+def db(fake_db, monkeypatch):
+    monkeypatch.setattr(gateway, 'get_db', lambda: fake_db)
+    return fake_db
+
+@pytest.fixture
+def client(db):
+    return gateway.app.test_client()
+
+def _insert(db, version=None, owner='alice'):
+    meta = {'owner': owner}
+    if version is not None: meta['version'] = version
+    _id = ObjectId()
+    db['items'].insert_one({'_id': _id, 'name': 'a', '_meta': meta})
+    return _id
+
+def test_get_sets_etag(client, db):
+    _id = _insert(db, version=3)
+    res = client.get(f'/api/items/{_id}', headers=ALICE)
+    assert res.headers['ETag'] == '"3"'
+
+def test_put_bumps_version(client, db):
+    _id = _insert(db, version=1)
+    res = client.put(f'/api/items/{_id}', json={'name': 'b'}, headers=ALICE)
+    assert res.status_code == 200
+    assert res.json['_version'] == 2
+    assert res.headers['ETag'] == '"2"'
+
+def test_put_if_match_on_legacy_document_without_version(client, db):
+    _id = _insert(db)
+    res = client.put(f'/api/items/{_id}', json={'name': 'b'}, headers={**ALICE, 'If-Match': '"0"'})
+    assert res.status_code == 200
+    assert db['items'].docs[_id]['_meta']['version'] == 1
+
+def test_put_stale_if_match_is_412(client, db):
+    _id = _insert(db, version=2)
+    res = client.put(f'/api/items/{_id}', json={'name': 'b'}, headers={**ALICE, 'If-Match': '"1"'})
+    assert res.status_code == 412
+    assert db['items'].docs[_id]['name'] == 'a'
+
+@pytest.mark.parametrize('owner', ['alice', 'bob'])
+def test_put_if_match_on_missing_or_foreign_document_is_404(client, db, owner):
+    _id = _insert(db, version=1, owner='bob') if owner == 'bob' else ObjectId()
+    res = client.put(f'/api/items/{_id}', json={'name': 'b'}, headers={**ALICE, 'If-Match': '"1"'})
+    assert res.status_code == 404
+
+def test_delete_stale_if_match_is_412(client, db):
+    _id = _insert(db, version=2)
+    res = client.delete(f'/api/items/{_id}', headers={**ALICE, 'If-Match': '"1"'})
+    assert res.status_code == 412
+    assert _id in db['items'].docs
+
+# --- admin editor ---
+
+def test_admin_update_derives_version_server_side(client, db):
+    _id = _insert(db, version=4)
+    res = client.put(f'/api/admin/record/items/{_id}', json={'name': 'b', '_client_id': 'alice'})
+    assert res.status_code == 200
+    assert db['items'].docs[_id]['_meta']['version'] == 5
+
+def test_admin_update_with_stale_version_is_409(client, db):
+    _id = _insert(db, version=4)
+    res = client.put(f'/api/admin/record/items/{_id}', json={'name': 'b', '_version': 3})
+    assert res.status_code == 409
+    assert db['items'].docs[_id]['_meta']['version'] == 4
+
+def test_admin_update_missing_record_is_404(client, db):
+    res = client.put(f'/api/admin/record/items/{ObjectId()}', json={'name': 'b', '_version': 1})
+    assert res.status_code == 404
+
+# --- multi-get ---
+
+def test_mget_keeps_request_order_and_removes_duplicates(client, db):
+    a, b, c = _insert(db), _insert(db), _insert(db)
+    ids = [str(c), str(a), str(c), str(b)]
+    res = client.post('/api/items/_mget', json={'ids': ids}, headers=ALICE)
+    assert res.status_code == 200
+    assert [d['_id'] for d in res.json] == [str(c), str(a), str(b)]
+
+def test_mget_excludes_documents_of_other_clients(client, db):
+    mine, theirs = _insert(db), _insert(db, owner='bob')
+    res = client.post('/api/items/_mget', json={'ids': [str(theirs), str(mine), str(ObjectId())]}, headers=ALICE)
+    assert [d['_id'] for d in res.json] == [str(mine)]
+
+@pytest.mark.parametrize('body', [{}, {'ids': 'abc'}, None])
+def test_mget_requires_ids_list(client, body):
+    res = client.post('/api/items/_mget', json=body, headers=ALICE)
+    assert res.status_code == 400
+
+def test_mget_limits_number_of_ids(client):
+    ids = [str(ObjectId()) for _ in range(gateway.MAX_MGET_IDS + 1)]
+    res = client.post('/api/items/_mget', json={'ids': ids}, headers=ALICE)
+    assert res.status_code == 413